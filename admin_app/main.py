@@ -0,0 +1,107 @@
+import json
+import os
+from typing import Any, Dict, List
+
+import pandas as pd
+import streamlit as st
+
+from admin_app.paths import SNAPSHOT_DIR, SNAPSHOT_FILE, SNAPSHOT_METADATA_FILE
+
+tipo_utente_cols: Dict[str, str] = {
+    "socio": "Socio/a",
+    "tesserato": "Tesserato/a",
+}
+
+activity_cols: Dict[str, str] = {
+    "kart": "Kart",
+    "moto": "Moto",
+    "altro": "Altro",
+}
+
+
+def snapshot_version() -> float:
+    metadata_path: str = os.path.join(SNAPSHOT_DIR, SNAPSHOT_METADATA_FILE)
+    return os.path.getmtime(metadata_path) if os.path.exists(metadata_path) else 0.0
+
+
+@st.cache_data(max_entries=2)
+def load_snapshot(version: float) -> pd.DataFrame:
+    return pd.read_parquet(os.path.join(SNAPSHOT_DIR, SNAPSHOT_FILE))
+
+
+@st.cache_data(max_entries=2)
+def load_metadata(version: float) -> Dict[str, Any]:
+    with open(os.path.join(SNAPSHOT_DIR, SNAPSHOT_METADATA_FILE)) as f:
+        return json.load(f)
+
+
+def filter_cube(cube: pd.DataFrame, tipi_utente: List[str], attivita: List[str]) -> pd.DataFrame:
+    mask = cube["tipo_utente"].isin(tipi_utente) & cube["attivita"].isin(attivita)
+    return cube[mask]
+
+
+def count_by(cube: pd.DataFrame, dimension: str) -> pd.Series:
+    return cube.groupby(dimension, observed=True)["utenti"].sum()
+
+
+def show_kpis(cube: pd.DataFrame) -> None:
+    total: int = int(cube["utenti"].sum())
+    minors: int = int(cube.loc[cube["minorenne"], "utenti"].sum())
+    by_type: pd.Series = count_by(cube, "tipo_utente")
+
+    columns = st.columns(4)
+    columns[0].metric("Utenti", total)
+    columns[1].metric("Minorenni", minors)
+    columns[2].metric("Soci", int(by_type.get("socio", 0)))
+    columns[3].metric("Tesserati", int(by_type.get("tesserato", 0)))
+
+
+def main():
+    st.set_page_config(page_title="KCP Admin", layout="wide")
+    st.title("KCP - Statistiche tesseramento")
+
+    version: float = snapshot_version()
+    if not version:
+        st.warning("Nessuno snapshot disponibile, esegui python -m admin_app.snapshot")
+        return
+
+    cube: pd.DataFrame = load_snapshot(version)
+    metadata: Dict[str, Any] = load_metadata(version)
+    st.caption(f"Dati aggiornati al {metadata['generato_il']}")
+
+    with st.sidebar:
+        tipi_utente: List[str] = st.multiselect(
+            label="Tipologia ammissione",
+            options=sorted(cube["tipo_utente"].unique()),
+            default=sorted(cube["tipo_utente"].unique()),
+            format_func=lambda x: tipo_utente_cols.get(x, x),
+        )
+        attivita: List[str] = st.multiselect(
+            label="Attivita'",
+            options=sorted(cube["attivita"].unique()),
+            default=sorted(cube["attivita"].unique()),
+            format_func=lambda x: activity_cols.get(x, x),
+        )
+        top_residenze: int = st.slider("Comuni di residenza mostrati", min_value=5, max_value=50, value=15)
+
+    cube = filter_cube(cube, tipi_utente, attivita)
+    show_kpis(cube)
+
+    left, right = st.columns(2)
+    with left:
+        st.subheader("Per tipologia", divider="red")
+        st.bar_chart(count_by(cube, "tipo_utente"))
+        st.subheader("Fasce di eta'", divider="red")
+        st.bar_chart(count_by(cube, "fascia_eta"))
+    with right:
+        st.subheader("Per attivita'", divider="red")
+        st.bar_chart(count_by(cube, "attivita"))
+        st.subheader("Registrazioni e rinnovi per mese", divider="red")
+        st.line_chart(count_by(cube, "mese_registrazione").sort_index())
+
+    st.subheader("Comuni di residenza", divider="red")
+    st.bar_chart(count_by(cube, "luogo_residenza").nlargest(top_residenze))
+
+
+if __name__ == "__main__":
+    main()
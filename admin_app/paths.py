@@ -0,0 +1,5 @@
+import os
+
+SNAPSHOT_DIR: str = os.environ.get("SNAPSHOT_DIR", "data/snapshots")
+SNAPSHOT_FILE: str = "membership_cube.parquet"
+SNAPSHOT_METADATA_FILE: str = "metadata.json"
@@ -0,0 +1,108 @@
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+import pendulum
+import sqlalchemy.engine
+
+from admin_app.paths import SNAPSHOT_DIR, SNAPSHOT_FILE, SNAPSHOT_METADATA_FILE
+from database import export
+from database.database import get_read_engine
+
+DEFAULT_TIMEZONE: str = "Europe/Rome"
+SNAPSHOT_REFRESH_SECONDS: int = int(os.environ.get("SNAPSHOT_REFRESH_SECONDS", 30 * 60))
+SNAPSHOT_PEAK_HOURS: str = os.environ.get("SNAPSHOT_PEAK_HOURS", "14-20")
+
+AGE_COHORTS_BINS: List[int] = [0, 12, 14, 18, 25, 35, 50, 65, 150]
+AGE_COHORTS_LABELS: List[str] = ["0-11", "12-13", "14-17", "18-24", "25-34", "35-49", "50-64", "65+"]
+CUBE_DIMENSIONS: List[str] = ["tipo_utente", "attivita", "fascia_eta", "minorenne", "mese_registrazione",
+                              "luogo_residenza"]
+
+logger = next(logging.getLogger(name) for name in logging.root.manager.loggerDict)
+
+
+def compute_ages(birth_dates: pd.Series, today: pendulum.Date) -> np.ndarray:
+    birth_dates = pd.to_datetime(birth_dates)
+    years: np.ndarray = today.year - birth_dates.dt.year.to_numpy()
+    birthday_not_reached: np.ndarray = (birth_dates.dt.month.to_numpy() > today.month) | (
+            (birth_dates.dt.month.to_numpy() == today.month) & (birth_dates.dt.day.to_numpy() > today.day))
+    return years - birthday_not_reached.astype(int)
+
+
+def build_membership_cube(users: pd.DataFrame, today: pendulum.Date) -> pd.DataFrame:
+    ages: np.ndarray = compute_ages(users["data_nascita"], today)
+    cube = pd.DataFrame({
+        "tipo_utente": users["tipo_utente"].fillna("n/d"),
+        "attivita": users["attivita"].fillna("n/d"),
+        "fascia_eta": pd.cut(ages, bins=AGE_COHORTS_BINS, labels=AGE_COHORTS_LABELS, right=False).astype(str),
+        "minorenne": ages < 18,
+        "mese_registrazione": pd.to_datetime(users["data_registrazione"]).dt.strftime("%Y-%m"),
+        "luogo_residenza": users["luogo_residenza"].fillna("").str.strip().str.title().replace("", "n/d"),
+    })
+    return cube.groupby(CUBE_DIMENSIONS, observed=True).size().rename("utenti").reset_index()
+
+
+def read_users(db_engine: sqlalchemy.engine.Engine) -> pd.DataFrame:
+    with db_engine.connect() as connection:
+        result = connection.execute(export.build_export_query())
+        return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+
+def write_snapshot(cube: pd.DataFrame, snapshot_dir: str = SNAPSHOT_DIR) -> Dict[str, Any]:
+    os.makedirs(snapshot_dir, exist_ok=True)
+    metadata: Dict[str, Any] = {
+        "generato_il": pendulum.now(tz=DEFAULT_TIMEZONE).to_iso8601_string(),
+        "utenti": int(cube["utenti"].sum()),
+        "righe": len(cube),
+    }
+
+    snapshot_path: str = os.path.join(snapshot_dir, SNAPSHOT_FILE)
+    cube.to_parquet(f"{snapshot_path}.tmp", index=False, compression="zstd")
+    os.replace(f"{snapshot_path}.tmp", snapshot_path)
+
+    metadata_path: str = os.path.join(snapshot_dir, SNAPSHOT_METADATA_FILE)
+    with open(f"{metadata_path}.tmp", "w") as f:
+        json.dump(metadata, f)
+    os.replace(f"{metadata_path}.tmp", metadata_path)
+
+    return metadata
+
+
+def refresh_snapshot(db_engine: sqlalchemy.engine.Engine, snapshot_dir: str = SNAPSHOT_DIR) -> Dict[str, Any]:
+    users: pd.DataFrame = read_users(db_engine)
+    cube: pd.DataFrame = build_membership_cube(users, pendulum.today(tz=DEFAULT_TIMEZONE).date())
+    return write_snapshot(cube, snapshot_dir)
+
+
+def is_peak_hour(now: pendulum.DateTime, peak_hours: str = SNAPSHOT_PEAK_HOURS) -> bool:
+    if not peak_hours:
+        return False
+    start, end = (int(hour) for hour in peak_hours.split("-"))
+    return start <= now.hour < end
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Aggiorna lo snapshot colonnare usato dalla dashboard admin")
+    parser.add_argument("--loop", action="store_true", help="Aggiorna periodicamente lo snapshot")
+    parser.add_argument("--output", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    while True:
+        snapshot_exists: bool = os.path.exists(os.path.join(args.output, SNAPSHOT_FILE))
+        if snapshot_exists and is_peak_hour(pendulum.now(tz=DEFAULT_TIMEZONE)):
+            logger.warning("peak hours, snapshot refresh skipped")
+        else:
+            logger.warning(f"snapshot refreshed {refresh_snapshot(get_read_engine(), args.output)}")
+
+        if not args.loop:
+            return
+        time.sleep(SNAPSHOT_REFRESH_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+import asyncio
+import hmac
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from api.idempotency import WRITE_METHODS, send_error
+
+RATE_LIMIT_PER_SECOND: float = 2.0
+RATE_LIMIT_BURST: int = 20
+MAX_TRACKED_CLIENTS: int = 10_000
+READ_CONCURRENCY: int = 8
+WRITE_CONCURRENCY: int = 4
+PRIORITY_RESERVED_SLOTS: int = 2
+QUEUE_SIZE: int = 32
+QUEUE_TIMEOUT_SECONDS: float = 2.0
+
+CLIENT_ID_HEADER: bytes = b"x-client-id"
+PRIORITY_TOKEN_HEADER: bytes = b"x-priority-token"
+PRIORITY_TOKEN: str = os.environ.get("ADMISSION_PRIORITY_TOKEN", "")
+PROXY_TOKEN_HEADER: bytes = b"x-proxy-token"
+PROXY_TOKEN: str = os.environ.get("ADMISSION_PROXY_TOKEN", "")
+EXEMPT_PATHS: List[str] = ["/admission/metrics", "/events/stream", "/timing/passings", "/docs", "/openapi.json"]
+
+READ_CLASS: str = "letture"
+WRITE_CLASS: str = "scritture"
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, now: float) -> None:
+        self.tokens: float = float(RATE_LIMIT_BURST)
+        self.updated_at: float = now
+
+    def take(self, now: float) -> float:
+        self.tokens = min(float(RATE_LIMIT_BURST), self.tokens + (now - self.updated_at) * RATE_LIMIT_PER_SECOND)
+        self.updated_at = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / RATE_LIMIT_PER_SECOND
+
+
+class RateLimiter:
+    def __init__(self) -> None:
+        self._buckets: OrderedDict[str, TokenBucket] = OrderedDict()
+        self.rejected: int = 0
+
+    def retry_after(self, client_id: str) -> float:
+        now: float = time.monotonic()
+        bucket: Optional[TokenBucket] = self._buckets.get(client_id)
+        if bucket is None:
+            bucket = self._buckets[client_id] = TokenBucket(now)
+            if len(self._buckets) > MAX_TRACKED_CLIENTS:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client_id)
+
+        if wait := bucket.take(now):
+            self.rejected += 1
+        return wait
+
+    @property
+    def clients(self) -> int:
+        return len(self._buckets)
+
+
+def waiting(queue: Deque[asyncio.Future]) -> int:
+    while queue and queue[0].done():
+        queue.popleft()
+    return sum(not waiter.done() for waiter in queue)
+
+
+class ConcurrencyLimiter:
+    def __init__(self, limit: int) -> None:
+        self.limit: int = limit
+        self.active: int = 0
+        self.admitted: int = 0
+        self.rejected: int = 0
+        self.timed_out: int = 0
+        self._priority: Deque[asyncio.Future] = deque()
+        self._normal: Deque[asyncio.Future] = deque()
+
+    def capacity(self, priority: bool) -> int:
+        return self.limit + (PRIORITY_RESERVED_SLOTS if priority else 0)
+
+    async def acquire(self, priority: bool) -> bool:
+        if not waiting(self._priority) and (priority or not waiting(self._normal)) \
+                and self.active < self.capacity(priority):
+            self.active += 1
+            self.admitted += 1
+            return True
+
+        queue: Deque[asyncio.Future] = self._priority if priority else self._normal
+        if waiting(queue) >= QUEUE_SIZE:
+            self.rejected += 1
+            return False
+
+        waiter: asyncio.Future = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=QUEUE_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            if not waiter.done() or waiter.cancelled():
+                self.timed_out += 1
+                return False
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        self.active -= 1
+        while self._priority or self._normal:
+            priority: bool = bool(self._priority)
+            queue: Deque[asyncio.Future] = self._priority if priority else self._normal
+            if self.active >= self.capacity(priority):
+                return
+            waiter: asyncio.Future = queue.popleft()
+            if waiter.done():
+                continue
+            self.active += 1
+            waiter.set_result(None)
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "limite": self.limit,
+            "attive": self.active,
+            "in_coda": waiting(self._normal),
+            "in_coda_prioritarie": waiting(self._priority),
+            "ammesse": self.admitted,
+            "rifiutate_coda_piena": self.rejected,
+            "scadute_in_coda": self.timed_out,
+        }
+
+
+class AdmissionController:
+    def __init__(self) -> None:
+        self.rate_limiter = RateLimiter()
+        self.limiters: Dict[str, ConcurrencyLimiter] = {
+            READ_CLASS: ConcurrencyLimiter(READ_CONCURRENCY),
+            WRITE_CLASS: ConcurrencyLimiter(WRITE_CONCURRENCY),
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "client_tracciati": self.rate_limiter.clients,
+            "rifiutate_rate_limit": self.rate_limiter.rejected,
+            **{route_class: limiter.metrics() for route_class, limiter in self.limiters.items()},
+        }
+
+
+def has_token(headers: Dict[bytes, bytes], header: bytes, token: str) -> bool:
+    return bool(token) and hmac.compare_digest(headers.get(header, b""), token.encode())
+
+
+def is_priority(headers: Dict[bytes, bytes]) -> bool:
+    return has_token(headers, PRIORITY_TOKEN_HEADER, PRIORITY_TOKEN)
+
+
+def client_id(scope: Scope, headers: Dict[bytes, bytes]) -> str:
+    if has_token(headers, PROXY_TOKEN_HEADER, PROXY_TOKEN) and (header := headers.get(CLIENT_ID_HEADER)):
+        return header.decode()
+    client = scope.get("client")
+    return client[0] if client else ""
+
+
+class AdmissionMiddleware:
+    def __init__(self, app: ASGIApp, controller: AdmissionController) -> None:
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+
+        headers: Dict[bytes, bytes] = dict(scope["headers"])
+        priority: bool = is_priority(headers)
+        if not priority and (wait := self.controller.rate_limiter.retry_after(client_id(scope, headers))):
+            return await send_error(send, 429, "Too many requests, slow down",
+                                    [(b"retry-after", str(math.ceil(wait)).encode())])
+
+        limiter: ConcurrencyLimiter = self.controller.limiters[
+            WRITE_CLASS if scope["method"] in WRITE_METHODS else READ_CLASS
+        ]
+        if not await limiter.acquire(priority):
+            return await send_error(send, 503, "Server busy, retry shortly",
+                                    [(b"retry-after", str(math.ceil(QUEUE_TIMEOUT_SECONDS)).encode())])
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
@@ -0,0 +1,111 @@
+import asyncio
+import itertools
+import json
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, NamedTuple, Optional, Set
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import Row
+from starlette.requests import Request
+
+EVENT_HISTORY_SIZE: int = 2000
+SUBSCRIBER_BUFFER_SIZE: int = 256
+HEARTBEAT_SECONDS: float = 15.0
+RETRY_MILLISECONDS: int = 2000
+
+REGISTRATION_EVENT: str = "registrazione"
+RENEWAL_EVENT: str = "rinnovo"
+GROUP_EVENT: str = "gruppo"
+RESET_EVENT: str = "reset"
+EVENT_TYPES: List[str] = [REGISTRATION_EVENT, RENEWAL_EVENT, GROUP_EVENT]
+
+
+class Event(NamedTuple):
+    id: str
+    sequence: int
+    tipo: str
+    data: Dict[str, Any]
+
+    def format(self) -> str:
+        return f"id: {self.id}\nevent: {self.tipo}\ndata: {json.dumps(self.data)}\n\n"
+
+
+def row_to_dict(row: Any) -> Dict[str, Any]:
+    if isinstance(row, Row):
+        return jsonable_encoder(row._asdict())
+    return jsonable_encoder({column.name: getattr(row, column.name) for column in row.__table__.columns})
+
+
+class Subscriber:
+    def __init__(self, tipi: Optional[Set[str]]) -> None:
+        self.tipi: Optional[Set[str]] = tipi
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_BUFFER_SIZE)
+        self.overflowed: bool = False
+
+    def wants(self, event: Event) -> bool:
+        return not self.tipi or event.tipo in self.tipi or event.tipo == RESET_EVENT
+
+    def offer(self, event: Event) -> None:
+        if self.overflowed or not self.wants(event):
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventBroker:
+    def __init__(self) -> None:
+        self.epoch: str = str(int(time.time() * 1000))
+        self._sequence: Iterator[int] = itertools.count(1)
+        self._history: Deque[Event] = deque(maxlen=EVENT_HISTORY_SIZE)
+        self._subscribers: Set[Subscriber] = set()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, tipo: str, data: Dict[str, Any]) -> Event:
+        sequence: int = next(self._sequence)
+        event = Event(f"{self.epoch}-{sequence}", sequence, tipo, jsonable_encoder(data))
+        self._history.append(event)
+        for subscriber in self._subscribers:
+            subscriber.offer(event)
+        return event
+
+    def subscribe(self, tipi: Optional[List[str]] = None, last_event_id: Optional[str] = None) -> Subscriber:
+        subscriber = Subscriber(set(tipi) if tipi else None)
+        for event in self.missed_events(last_event_id):
+            subscriber.offer(event)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+
+    def missed_events(self, last_event_id: Optional[str]) -> List[Event]:
+        if not last_event_id:
+            return []
+
+        epoch, _, sequence = last_event_id.partition("-")
+        oldest_sequence: int = self._history[0].sequence if self._history else 0
+        if epoch != self.epoch or not sequence.isdigit() or int(sequence) + 1 < oldest_sequence:
+            return [Event(f"{self.epoch}-0", 0, RESET_EVENT, {"motivo": "eventi non piu' disponibili"})]
+
+        return [event for event in self._history if event.sequence > int(sequence)]
+
+
+async def event_stream(request: Request, broker: EventBroker, subscriber: Subscriber) -> AsyncIterator[str]:
+    try:
+        yield f"retry: {RETRY_MILLISECONDS}\n\n"
+        while not subscriber.overflowed or not subscriber.queue.empty():
+            try:
+                event: Event = await asyncio.wait_for(subscriber.queue.get(), timeout=HEARTBEAT_SECONDS)
+                yield event.format()
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+    finally:
+        broker.unsubscribe(subscriber)
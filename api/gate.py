@@ -0,0 +1,47 @@
+import hashlib
+import os
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from database import crud
+from gate import snapshot
+
+GATE_SALT: bytes = hashlib.blake2b(os.environ.get("GATE_SNAPSHOT_SALT", "kcp-registration").encode(),
+                                   digest_size=snapshot.SALT_SIZE).digest()
+DELTA_OVERLAP: timedelta = timedelta(minutes=5)
+MAX_DELTA_AGE: timedelta = timedelta(days=7)
+VERSION_EPOCH: datetime = datetime(1970, 1, 1)
+SNAPSHOT_MEDIA_TYPE: str = "application/octet-stream"
+VERSION_HEADER: str = "X-Snapshot-Version"
+
+
+def to_version(*changes: Optional[datetime]) -> int:
+    if not (timestamps := [change.replace(tzinfo=None) for change in changes if change is not None]):
+        return 0
+    return -((VERSION_EPOCH - max(timestamps)) // timedelta(milliseconds=1))
+
+
+def from_version(version: int) -> datetime:
+    return VERSION_EPOCH + timedelta(milliseconds=version)
+
+
+def build_full_snapshot(db: Session, version: int, today: date) -> bytes:
+    members = crud.get_gate_members(db, registered_since=today - timedelta(days=snapshot.VALIDITY_DAYS))
+    return snapshot.build(snapshot.FULL_SNAPSHOT, version, 0, members, GATE_SALT)
+
+
+def needs_full_snapshot(db: Session, since: int, version: int) -> bool:
+    if since > version or from_version(since) < from_version(version) - MAX_DELTA_AGE:
+        return True
+    return crud.count_user_tombstones(db, from_version(since)) > 0
+
+
+def build_delta_snapshot(db: Session, since: int, version: int) -> Optional[bytes]:
+    if since >= version:
+        return None
+    members = crud.get_gate_members(db, changed_since=from_version(since) - DELTA_OVERLAP)
+    if not members:
+        return None
+    return snapshot.build(snapshot.DELTA_SNAPSHOT, version, since, members, GATE_SALT)
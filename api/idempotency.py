@@ -0,0 +1,168 @@
+import asyncio
+import json
+import logging
+from datetime import timedelta
+from hashlib import sha256
+from typing import Any, Dict, List, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from database import crud
+from database.database import SessionLocal
+
+IDEMPOTENCY_HEADER: bytes = b"idempotency-key"
+IDEMPOTENCY_TTL: timedelta = timedelta(hours=24)
+IDEMPOTENCY_PRUNE_SECONDS: int = 15 * 60
+IDEMPOTENCY_MAX_KEY_LENGTH: int = 255
+WRITE_METHODS: List[str] = ["POST", "PUT", "PATCH", "DELETE"]
+ERROR_MESSAGE_FIELD: str = "message"
+
+logger = next(logging.getLogger(name) for name in logging.root.manager.loggerDict)
+
+
+def request_fingerprint(scope: Scope, body: bytes) -> str:
+    digest = sha256()
+    for part in (scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body):
+        digest.update(part)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def claim(key: str, fingerprint: str) -> bool:
+    with SessionLocal() as db:
+        return crud.claim_idempotency_key(db, key, fingerprint, IDEMPOTENCY_TTL)
+
+
+def lookup(key: str) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as db:
+        if stored := crud.get_idempotency_key(db, key):
+            return {
+                "impronta": stored.impronta,
+                "status_code": stored.status_code,
+                "content_type": stored.content_type,
+                "risposta": stored.risposta,
+            }
+        return None
+
+
+def complete(key: str, status_code: int, content_type: Optional[str], body: bytes) -> None:
+    with SessionLocal() as db:
+        crud.complete_idempotency_key(db, key, status_code, content_type, body)
+
+
+def release(key: str) -> None:
+    with SessionLocal() as db:
+        crud.release_idempotency_key(db, key)
+
+
+def prune() -> int:
+    with SessionLocal() as db:
+        return crud.prune_idempotency_keys(db, IDEMPOTENCY_TTL)
+
+
+async def prune_periodically() -> None:
+    while True:
+        await asyncio.sleep(IDEMPOTENCY_PRUNE_SECONDS)
+        try:
+            if deleted := await run_in_threadpool(prune):
+                logger.warning(f"pruned {deleted} expired idempotency keys")
+        except Exception as e:
+            logger.warning(f"failed to prune idempotency keys: {e}")
+
+
+async def send_response(send: Send, status_code: int, body: bytes, content_type: Optional[str],
+                        extra_headers: Optional[List[tuple]] = None) -> None:
+    headers: List[tuple] = [(b"content-length", str(len(body)).encode())]
+    if content_type:
+        headers.append((b"content-type", content_type.encode()))
+    headers.extend(extra_headers or [])
+
+    await send({"type": "http.response.start", "status": status_code, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_error(send: Send, status_code: int, message: str, extra_headers: Optional[List[tuple]] = None) \
+        -> None:
+    body: bytes = json.dumps({"message": message, "data": ""}).encode()
+    await send_response(send, status_code, body, "application/json", extra_headers)
+
+
+def is_error_response(status_code: int, content_type: Optional[str], body: bytes) -> bool:
+    if status_code >= 500:
+        return True
+    if not (content_type or "").startswith("application/json"):
+        return False
+    try:
+        payload: Any = json.loads(body)
+    except ValueError:
+        return False
+    return isinstance(payload, dict) and ERROR_MESSAGE_FIELD in payload
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS:
+            return await self.app(scope, receive, send)
+
+        key: str = dict(scope["headers"]).get(IDEMPOTENCY_HEADER, b"").decode().strip()
+        if not key:
+            return await self.app(scope, receive, send)
+        if len(key) > IDEMPOTENCY_MAX_KEY_LENGTH:
+            return await send_error(send, 400, f"Idempotency-Key longer than {IDEMPOTENCY_MAX_KEY_LENGTH} chars")
+
+        messages: List[Message] = []
+        body: bytes = b""
+        more_body: bool = True
+        while more_body:
+            message: Message = await receive()
+            messages.append(message)
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+        fingerprint: str = request_fingerprint(scope, body)
+        if not await run_in_threadpool(claim, key, fingerprint):
+            return await self.replay(key, fingerprint, send)
+
+        async def replay_receive() -> Message:
+            return messages.pop(0) if messages else await receive()
+
+        response: Dict[str, Any] = {"status_code": 500, "content_type": None, "body": b""}
+
+        async def capture_send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                response["status_code"] = message["status"]
+                response["content_type"] = dict(message.get("headers", [])).get(b"content-type", b"").decode()
+            elif message["type"] == "http.response.body":
+                response["body"] += message.get("body", b"")
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except Exception:
+            await run_in_threadpool(release, key)
+            raise
+
+        if is_error_response(response["status_code"], response["content_type"], response["body"]):
+            await run_in_threadpool(release, key)
+        else:
+            await run_in_threadpool(complete, key, response["status_code"], response["content_type"],
+                                    response["body"])
+
+    @staticmethod
+    async def replay(key: str, fingerprint: str, send: Send) -> None:
+        stored: Optional[Dict[str, Any]] = await run_in_threadpool(lookup, key)
+        if not stored:
+            return await send_error(send, 409, "Request with this Idempotency-Key is being processed",
+                                    [(b"retry-after", b"1")])
+        if stored["impronta"] != fingerprint:
+            return await send_error(send, 422, "Idempotency-Key already used for a different request")
+        if stored["status_code"] is None:
+            return await send_error(send, 409, "Request with this Idempotency-Key is being processed",
+                                    [(b"retry-after", b"1")])
+
+        await send_response(send, stored["status_code"], stored["risposta"] or b"", stored["content_type"],
+                            [(b"idempotent-replayed", b"true")])
@@ -1,58 +1,237 @@
+import asyncio
 import logging
-from typing import Dict, List, Union
+from datetime import date
+from hashlib import sha256
+from typing import Any, Dict, List, Optional, Union
 
+import pendulum
 import uvicorn
-from fastapi import Depends, FastAPI
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
-from database import crud, models, schemas
-from database.database import SessionLocal, engine
+from api import events, gate
+from api.admission import AdmissionController, AdmissionMiddleware
+from api.idempotency import IdempotencyMiddleware, prune_periodically
+from api.places import PlaceIndex, with_place_codes
+from api.scheduler import SessionScheduler, is_minor, to_group_assignments
+from api.timing import LapTimer, flush_periodically, load_group_transponders
+from database import crud, export, models, partitions, schemas
+from database.database import SessionLocal, create_read_session, engine
 from database.schemas import Group
 
 logger = next(logging.getLogger(name) for name in logging.root.manager.loggerDict)
 models.Base.metadata.create_all(bind=engine)
+partitions.ensure_partitions(engine)
+
+PARTITIONS_CHECK_SECONDS: int = 24 * 60 * 60
+PLACES_CACHE_CONTROL: str = "public, max-age=86400"
 
 app = FastAPI()
+app.state.admission = AdmissionController()
+app.add_middleware(IdempotencyMiddleware)
+app.add_middleware(AdmissionMiddleware, controller=app.state.admission)
+app.state.scheduler = SessionScheduler()
+app.state.lap_timer = LapTimer()
+app.state.events = events.EventBroker()
+app.state.places = PlaceIndex.load()
+app.state.gate_snapshot = None
+
+
+async def ensure_partitions_periodically() -> None:
+    while True:
+        await asyncio.sleep(PARTITIONS_CHECK_SECONDS)
+        try:
+            if created := await run_in_threadpool(partitions.ensure_partitions, engine):
+                logger.warning(f"created partitions {created}")
+        except Exception as e:
+            logger.warning(f"failed to create partitions: {e}")
+
+
+@app.on_event("startup")
+async def start_background_tasks() -> None:
+    app.state.prune_idempotency_keys = asyncio.create_task(prune_periodically())
+    app.state.ensure_partitions = asyncio.create_task(ensure_partitions_periodically())
+    app.state.flush_lap_passings = asyncio.create_task(flush_periodically(app.state.lap_timer))
+
+
+def get_client_id(request: Request) -> Optional[str]:
+    return request.headers.get("X-Client-Id") or (request.client.host if request.client else None)
 
 
 # Dependency
-def get_db():
-    db = SessionLocal()
+def get_db(request: Request):
+    db = SessionLocal(info={"client_id": get_client_id(request)})
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(request: Request):
+    db = create_read_session(
+        client_id=get_client_id(request),
+        force_primary=request.headers.get("X-Read-Your-Writes", "").lower() in ["1", "true"],
+    )
     try:
         yield db
     finally:
         db.close()
 
 
+def make_etag(*parts: Any) -> str:
+    digest: str = sha256("|".join(str(part) for part in parts).encode("utf8")).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip() for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates or etag.removeprefix("W/") in candidates
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag})
+
+
+@app.get("/admission/metrics")
+async def get_admission_metrics() -> Dict[str, Any]:
+    return app.state.admission.metrics()
+
+
+@app.get("/places/")
+async def search_places(response: Response, q: str, limit: int = Query(10, ge=1, le=50),
+                        provincia: Optional[str] = None, include_inactive: bool = False) -> List[schemas.Place]:
+    response.headers["Cache-Control"] = PLACES_CACHE_CONTROL
+    places = app.state.places.search(q, limit=limit, include_inactive=include_inactive, provincia=provincia)
+    return [place.to_schema() for place in places]
+
+
+@app.get("/places/{code}")
+async def get_place(code: str, response: Response) -> schemas.Place:
+    if not (place := app.state.places.by_code(code)):
+        raise HTTPException(status_code=404, detail="Place not found")
+    response.headers["Cache-Control"] = PLACES_CACHE_CONTROL
+    return place.to_schema()
+
+
+@app.get("/gate/snapshot")
+async def get_gate_snapshot(if_none_match: Optional[str] = Header(None), db: Session = Depends(get_read_db)):
+    try:
+        count, last_modified, last_deleted = crud.get_gate_version(db=db)
+        today: date = date.today()
+        version: int = gate.to_version(last_modified, last_deleted)
+        etag: str = make_etag("gate", count, version, today)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+        if app.state.gate_snapshot is None or app.state.gate_snapshot[0] != etag:
+            data: bytes = await run_in_threadpool(gate.build_full_snapshot, db, version, today)
+            app.state.gate_snapshot = (etag, data)
+        return Response(app.state.gate_snapshot[1], media_type=gate.SNAPSHOT_MEDIA_TYPE,
+                        headers={"ETag": etag, gate.VERSION_HEADER: str(version)})
+    except Exception as e:
+        return {"message": f"Failed to execute query: {e}", "data": ""}
+
+
+@app.get("/gate/snapshot/delta")
+async def get_gate_snapshot_delta(since: int = Query(..., ge=0), db: Session = Depends(get_read_db)):
+    try:
+        _, last_modified, last_deleted = crud.get_gate_version(db=db)
+        version: int = gate.to_version(last_modified, last_deleted)
+        headers: Dict[str, str] = {gate.VERSION_HEADER: str(version)}
+        if gate.needs_full_snapshot(db, since, version):
+            return Response(status_code=410, headers=headers)
+        if not (data := gate.build_delta_snapshot(db, since, version)):
+            return Response(status_code=304, headers=headers)
+        return Response(data, media_type=gate.SNAPSHOT_MEDIA_TYPE, headers=headers)
+    except Exception as e:
+        return {"message": f"Failed to execute query: {e}", "data": ""}
+
+
 @app.post("/users/")
 async def sign_up(user: schemas.UserCreate, db: Session = Depends(get_db)):
     try:
-        return crud.add_user(db=db, user=user)
+        db_user, created = crud.get_or_add_user(db=db, user=with_place_codes(app.state.places, user))
+        if created:
+            app.state.events.publish(events.REGISTRATION_EVENT, events.row_to_dict(db_user))
+        return db_user
     except Exception as e:
         return {"message": "Data not found", "data": f"{e}", "original": user.model_dump()}
 
 
 @app.get("/users/{fiscal_code}")
-async def get_user(fiscal_code: str, db: Session = Depends(get_db)):
+async def get_user(fiscal_code: str, response: Response, if_none_match: Optional[str] = Header(None),
+                   db: Session = Depends(get_read_db)):
     try:
+        if version := crud.get_user_version(db=db, codice_fiscale=fiscal_code):
+            etag: str = make_etag("user", *version)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+            response.headers["ETag"] = etag
         return crud.get_user_by_codice_fiscale(db=db, codice_fiscale=fiscal_code)
     except Exception as e:
         return {"message": "Data not found", "data": f"{e}"}
 
 
 @app.get("/users/")
-async def get_user(db: Session = Depends(get_db)):
+async def get_users(response: Response, skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=100),
+                    if_none_match: Optional[str] = Header(None), db: Session = Depends(get_read_db)):
     try:
-        return crud.get_users(db=db)
+        etag: str = make_etag("users", skip, limit, *crud.get_users_version(db=db, skip=skip, limit=limit))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
+        return crud.get_users(db=db, skip=skip, limit=limit)
     except Exception as e:
         return {"message": "Data not found", "data": f"{e}"}
 
 
+def publish_groups(db_groups: List[models.Group], user_ids: List[List[int]]) -> None:
+    for db_group, group_user_ids in zip(db_groups, user_ids):
+        app.state.events.publish(events.GROUP_EVENT, {**events.row_to_dict(db_group), "user_ids": group_user_ids})
+
+
+@app.get("/events/stream")
+async def stream_events(request: Request, tipi: Optional[List[str]] = Query(None),
+                        last_event_id: Optional[str] = Header(None)) -> StreamingResponse:
+    last_event_id = last_event_id or request.query_params.get("last_event_id")
+    subscriber = app.state.events.subscribe(tipi=tipi, last_event_id=last_event_id)
+    return StreamingResponse(
+        events.event_stream(request, app.state.events, subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def export_session_chunks(season: Optional[int], include_children: bool):
+    db = create_read_session()
+    try:
+        yield from export.iter_export_chunks(db=db, season=season, include_children=include_children)
+    finally:
+        db.close()
+
+
+@app.get("/export/users")
+async def export_users(export_format: str = "csv", season: Optional[int] = None, include_children: bool = False) \
+        -> StreamingResponse:
+    if export_format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format, use one of {export.EXPORT_FORMATS}")
+
+    chunks = export_session_chunks(season=season, include_children=include_children)
+    return StreamingResponse(
+        export.stream_export(chunks, export_format=export_format, include_children=include_children),
+        media_type="application/vnd.apache.parquet" if export_format == "parquet" else "application/gzip",
+        headers={"Content-Disposition": f'attachment; filename="{export.export_file_name(export_format, season)}"'},
+    )
+
+
 @app.delete("/childrens/")
 async def remove_children(children_id: List[int], db: Session = Depends(get_db)) -> Union[bool, Dict[str, str]]:
     try:
-        crud.remove_children_by_id(db, children_id)
-        return True
+        return bool(crud.remove_children_by_id(db, children_id))
     except Exception as e:
         return {"message": "Data not found", "data": f"{e}"}
 
@@ -61,16 +240,134 @@ async def remove_children(children_id: List[int], db: Session = Depends(get_db))
 async def add_children(parent_id: int, children: List[schemas.UserCreate], db: Session = Depends(get_db)) -> \
         Dict[str, str] | List[int]:
     try:
-        return crud.add_children(db=db, children=children, parent_id=parent_id)
+        children = [with_place_codes(app.state.places, child) for child in children]
+        children_ids, added_children = crud.add_children(db=db, children=children, parent_id=parent_id)
+        for child in added_children:
+            app.state.events.publish(events.REGISTRATION_EVENT, events.row_to_dict(child))
+        return children_ids
     except Exception as e:
         return {"message": f"Failed to execute query: {e}", "data": ""}
 
 
 @app.post("/groups/")
-async def add_group(users: List[schemas.User], group_name: str, ticket_id: int, db: Session = Depends(get_db)) \
+async def add_group(users: List[schemas.User], group_name: str, db: Session = Depends(get_db)) \
         -> Group | Dict[str, str]:
     try:
-        return crud.add_group(db=db, users=users, group_name=group_name, ticket_id=ticket_id)
+        db_group = crud.add_group(db=db, users=users, group_name=group_name)
+        publish_groups([db_group], [[user.id for user in users]])
+        return db_group
+    except Exception as e:
+        return {"message": f"Failed to execute query: {e}", "data": ""}
+
+
+@app.post("/groups/batch")
+async def add_groups(groups: List[schemas.GroupAssignment], db: Session = Depends(get_db)) \
+        -> List[Group] | Dict[str, str]:
+    try:
+        db_groups = crud.add_groups(db=db, groups=groups)
+        publish_groups(db_groups, [group.user_ids for group in groups])
+        return db_groups
+    except Exception as e:
+        return {"message": f"Failed to execute query: {e}", "data": ""}
+
+
+@app.get("/groups/{group_id}")
+async def get_group(group_id: int, response: Response, day: Optional[date] = None,
+                    if_none_match: Optional[str] = Header(None), db: Session = Depends(get_read_db)):
+    try:
+        if version := crud.get_group_version(db=db, group_id=group_id, day=day):
+            etag: str = make_etag("group", *version)
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag)
+            response.headers["ETag"] = etag
+        return crud.get_group_by_id(db=db, group_id=group_id, day=day)
+    except Exception as e:
+        return {"message": "Data not found", "data": f"{e}"}
+
+
+@app.get("/groups/")
+async def get_groups(response: Response, day: Optional[date] = None, if_none_match: Optional[str] = Header(None),
+                     db: Session = Depends(get_read_db)):
+    day = day or pendulum.today(tz=crud.DEFAULT_TIMEZONE).date()
+    try:
+        etag: str = make_etag("groups", day, *crud.get_groups_by_day_version(db=db, day=day))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+        response.headers["ETag"] = etag
+        return crud.get_groups_by_day(db=db, day=day)
+    except Exception as e:
+        return {"message": "Data not found", "data": f"{e}"}
+
+
+@app.put("/groups/{group_id}/transponders")
+async def assign_transponders(group_id: int, transponders: Dict[int, str], day: Optional[date] = None,
+                              db: Session = Depends(get_db)) -> int | Dict[str, str]:
+    try:
+        updated: int = crud.assign_transponders(db=db, group_id=group_id, transponders=transponders, day=day)
+        app.state.lap_timer.activate_group(group_id, crud.get_group_transponders(db=db, group_id=group_id, day=day))
+        return updated
+    except Exception as e:
+        return {"message": f"Failed to execute query: {e}", "data": ""}
+
+
+@app.post("/timing/groups/{group_id}")
+async def activate_timing(group_id: int, day: Optional[date] = None) -> Dict[str, int]:
+    transponders: Dict[str, int] = await run_in_threadpool(load_group_transponders, group_id, day)
+    app.state.lap_timer.activate_group(group_id, transponders)
+    return transponders
+
+
+@app.post("/timing/passings", status_code=202)
+async def record_passings(passings: List[schemas.Passing]) -> Dict[str, int]:
+    return {"accepted": app.state.lap_timer.record(passings), "pending": app.state.lap_timer.pending}
+
+
+@app.get("/timing/leaderboard/{group_id}")
+async def get_leaderboard(group_id: int) -> List[schemas.LeaderboardEntry]:
+    return app.state.lap_timer.leaderboard(group_id)
+
+
+@app.get("/scheduler/plan")
+async def get_schedule() -> List[schemas.PlannedSession]:
+    return app.state.scheduler.plan()
+
+
+@app.post("/scheduler/queue")
+async def check_in(user_ids: List[int], db: Session = Depends(get_db)) \
+        -> List[schemas.PlannedSession] | Dict[str, Any]:
+    try:
+        today: date = pendulum.today(tz=crud.DEFAULT_TIMEZONE).date()
+        users_by_id = {user.id: user for user in crud.get_users_by_ids(db=db, user_ids=user_ids)}
+        if missing := [user_id for user_id in user_ids if user_id not in users_by_id]:
+            return {"message": "Users not found, nobody was checked in", "data": missing}
+        for user_id in user_ids:
+            user = users_by_id[user_id]
+            app.state.scheduler.check_in(user.id, user.attivita, is_minor(user.data_nascita, today))
+        return app.state.scheduler.plan()
+    except Exception as e:
+        return {"message": f"Failed to execute query: {e}", "data": ""}
+
+
+@app.delete("/scheduler/queue/{user_id}")
+async def leave_queue(user_id: int) -> List[schemas.PlannedSession]:
+    app.state.scheduler.remove(user_id)
+    return app.state.scheduler.plan()
+
+
+@app.put("/scheduler/rules")
+async def set_track_rules(rules: schemas.TrackRules) -> List[schemas.PlannedSession]:
+    app.state.scheduler.set_rules(rules)
+    return app.state.scheduler.plan()
+
+
+@app.post("/scheduler/commit")
+async def commit_schedule(db: Session = Depends(get_db)) -> List[Group] | Dict[str, str]:
+    try:
+        assignments: List[schemas.GroupAssignment] = to_group_assignments(app.state.scheduler.plan())
+        groups = crud.add_groups(db=db, groups=assignments)
+        app.state.scheduler.clear()
+        publish_groups(groups, [assignment.user_ids for assignment in assignments])
+        return groups
     except Exception as e:
         return {"message": f"Failed to execute query: {e}", "data": ""}
 
@@ -79,7 +376,31 @@ async def add_group(users: List[schemas.User], group_name: str, ticket_id: int,
 async def update_user(user: schemas.UserBase, db: Session = Depends(get_db)) -> int | Dict[str, str]:
     logger.warning(f"data received by fast api update_user {user}")
     try:
-        return crud.update_user(db=db, user=user).id
+        db_user = crud.update_user(db=db, user=with_place_codes(app.state.places, user))
+        app.state.events.publish(events.RENEWAL_EVENT, events.row_to_dict(db_user))
+        return db_user.id
+    except Exception as e:
+        return {"message": f"Failed to execute query: {e}", "data": ""}
+
+
+def publish_renewals(rows: List[Any]) -> List[int]:
+    for row in rows:
+        app.state.events.publish(events.RENEWAL_EVENT, events.row_to_dict(row))
+    return [row.id for row in rows]
+
+
+@app.put("/users/renew")
+async def renew_users(fiscal_codes: List[str], db: Session = Depends(get_db)) -> List[int] | Dict[str, str]:
+    try:
+        return publish_renewals(crud.renew_users(db=db, fiscal_codes=fiscal_codes))
+    except Exception as e:
+        return {"message": f"Failed to execute query: {e}", "data": ""}
+
+
+@app.put("/families/{parent_id}/renew")
+async def renew_family(parent_id: int, db: Session = Depends(get_db)) -> List[int] | Dict[str, str]:
+    try:
+        return publish_renewals(crud.renew_family(db=db, parent_id=parent_id))
     except Exception as e:
         return {"message": f"Failed to execute query: {e}", "data": ""}
 
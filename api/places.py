@@ -0,0 +1,121 @@
+import bisect
+import itertools
+import json
+import re
+import unicodedata
+from importlib import resources
+from typing import Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from database import schemas
+
+PLACES_PACKAGE: str = "codicefiscale"
+PLACES_FILES: List[str] = ["data/municipalities.json", "data/countries.json"]
+MAX_RESULTS: int = 10
+NON_ALPHANUMERIC: re.Pattern = re.compile(r"[^a-z0-9]+")
+
+
+class Place(NamedTuple):
+    codice: str
+    nome: str
+    provincia: str
+    attivo: bool
+
+    def to_schema(self) -> schemas.Place:
+        return schemas.Place(codice=self.codice, nome=self.nome, provincia=self.provincia, attivo=self.attivo)
+
+
+def normalize(text: str) -> str:
+    ascii_text: str = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode()
+    return NON_ALPHANUMERIC.sub(" ", ascii_text.lower()).strip()
+
+
+def load_places() -> List[Place]:
+    places: List[Place] = []
+    for file_name in PLACES_FILES:
+        with resources.files(PLACES_PACKAGE).joinpath(file_name).open("rb") as f:
+            places.extend(
+                Place(place["code"], place["name"], place["province"], place["active"])
+                for place in json.load(f)
+            )
+    return places
+
+
+class PrefixIndex(NamedTuple):
+    keys: List[str]
+    places: List[Place]
+
+    @classmethod
+    def build(cls, entries: Set[Tuple[str, int]], places: List[Place]) -> "PrefixIndex":
+        ordered: List[Tuple[str, int]] = sorted(entries, key=lambda entry: (entry[0], not places[entry[1]].attivo))
+        return cls([key for key, _ in ordered], [places[position] for _, position in ordered])
+
+    def matches(self, prefix: str) -> Iterator[Place]:
+        for index in range(bisect.bisect_left(self.keys, prefix), len(self.keys)):
+            if not self.keys[index].startswith(prefix):
+                return
+            yield self.places[index]
+
+
+class PlaceIndex:
+    def __init__(self, places: List[Place]) -> None:
+        names: Set[Tuple[str, int]] = set()
+        words: Set[Tuple[str, int]] = set()
+        for position, place in enumerate(places):
+            name_words: List[str] = normalize(place.nome).split()
+            names.add((" ".join(name_words), position))
+            words.update((" ".join(name_words[start:]), position) for start in range(1, len(name_words)))
+
+        self._names: PrefixIndex = PrefixIndex.build(names, places)
+        self._words: PrefixIndex = PrefixIndex.build(words, places)
+        self._by_code: Dict[str, Place] = {}
+        self._by_name: Dict[str, List[Place]] = {}
+        for place in places:
+            if place.attivo or place.codice not in self._by_code:
+                self._by_code[place.codice] = place
+            self._by_name.setdefault(normalize(place.nome), []).append(place)
+
+    def __len__(self) -> int:
+        return len(self._by_code)
+
+    @classmethod
+    def load(cls) -> "PlaceIndex":
+        return cls(load_places())
+
+    def search(self, query: str, limit: int = MAX_RESULTS, include_inactive: bool = False,
+               provincia: Optional[str] = None) -> List[Place]:
+        prefix: str = normalize(query)
+        if not prefix:
+            return []
+
+        results: Dict[str, Place] = {}
+        for place in itertools.chain(self._names.matches(prefix), self._words.matches(prefix)):
+            if len(results) >= limit:
+                break
+            if (include_inactive or place.attivo) and (not provincia or place.provincia == provincia.upper()):
+                results.setdefault(place.codice, place)
+        return list(results.values())
+
+    def by_code(self, codice: Optional[str]) -> Optional[Place]:
+        return self._by_code.get((codice or "").upper())
+
+    def resolve(self, nome: Optional[str], codice: Optional[str] = None,
+                include_inactive: bool = False) -> Optional[Place]:
+        if (place := self.by_code(codice)) and (include_inactive or place.attivo):
+            return place
+
+        candidates: List[Place] = self._by_name.get(normalize(nome or ""), [])
+        active: List[Place] = [place for place in candidates if place.attivo]
+        candidates = active or candidates if include_inactive else active
+        return candidates[0] if len({place.codice for place in candidates}) == 1 else None
+
+
+def with_place_codes(index: PlaceIndex, user: schemas.UserBase) -> schemas.UserBase:
+    updates: Dict[str, Optional[str]] = {}
+    for name_field, code_field, include_inactive in [("luogo_nascita", "codice_luogo_nascita", True),
+                                                     ("luogo_residenza", "codice_luogo_residenza", False)]:
+        place: Optional[Place] = index.resolve(getattr(user, name_field), getattr(user, code_field),
+                                               include_inactive)
+        updates[code_field] = place.codice if place else None
+        if place:
+            updates[name_field] = place.nome
+    return user.model_copy(update=updates)
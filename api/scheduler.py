@@ -0,0 +1,125 @@
+import bisect
+import heapq
+import itertools
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import pendulum
+
+from database import schemas
+
+DEFAULT_TIMEZONE: str = "Europe/Rome"
+
+BucketKey = Tuple[str, Optional[bool]]
+
+
+class QueuedMember(NamedTuple):
+    user_id: int
+    attivita: str
+    minorenne: bool
+    position: int
+
+
+def is_minor(birth_date: date, today: date) -> bool:
+    return (today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))) < 18
+
+
+def session_name(attivita: str, minorenni: Optional[bool], start: datetime) -> str:
+    heat: str = "" if minorenni is None else (" Minori" if minorenni else " Adulti")
+    return f"{attivita.capitalize()}{heat} {start:%H:%M}"
+
+
+class SessionScheduler:
+    def __init__(self, rules: Optional[schemas.TrackRules] = None) -> None:
+        self.rules: schemas.TrackRules = rules or schemas.TrackRules()
+        self._positions: Iterator[int] = itertools.count()
+        self._members: Dict[int, QueuedMember] = {}
+        self._buckets: Dict[BucketKey, List[QueuedMember]] = {}
+        self._sessions: Dict[BucketKey, List[List[QueuedMember]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._members
+
+    def bucket_key(self, member: QueuedMember) -> BucketKey:
+        return member.attivita, member.minorenne if self.rules.separa_minorenni else None
+
+    def set_rules(self, rules: schemas.TrackRules) -> None:
+        members: List[QueuedMember] = sorted(self._members.values(), key=lambda member: member.position)
+        self.rules = rules
+        self._members, self._buckets, self._sessions = {}, {}, {}
+        self._enqueue(members)
+
+    def check_in(self, user_id: int, attivita: str, minorenne: bool) -> None:
+        if user_id not in self._members:
+            self._enqueue([QueuedMember(user_id, attivita or "kart", minorenne, next(self._positions))])
+
+    def _enqueue(self, members: Iterable[QueuedMember]) -> None:
+        first_changed: Dict[BucketKey, int] = {}
+        for member in members:
+            self._members[member.user_id] = member
+            key: BucketKey = self.bucket_key(member)
+            bucket: List[QueuedMember] = self._buckets.setdefault(key, [])
+            first_changed.setdefault(key, len(bucket))
+            bucket.append(member)
+
+        for key, index in first_changed.items():
+            self._split_sessions(key, index)
+
+    def remove(self, user_id: int) -> bool:
+        if not (member := self._members.pop(user_id, None)):
+            return False
+
+        key: BucketKey = self.bucket_key(member)
+        bucket: List[QueuedMember] = self._buckets[key]
+        index: int = bisect.bisect_left(bucket, member.position, key=lambda queued: queued.position)
+        del bucket[index]
+        self._split_sessions(key, index)
+        return True
+
+    def clear(self) -> None:
+        self._members, self._buckets, self._sessions = {}, {}, {}
+
+    def _split_sessions(self, key: BucketKey, from_index: int) -> None:
+        bucket: List[QueuedMember] = self._buckets[key]
+        if not bucket:
+            del self._buckets[key]
+            self._sessions.pop(key, None)
+            return
+
+        capacity: int = max(self.rules.capienza, 1)
+        first_session: int = from_index // capacity
+        sessions: List[List[QueuedMember]] = self._sessions.setdefault(key, [])
+        del sessions[first_session:]
+        sessions.extend(bucket[start:start + capacity]
+                        for start in range(first_session * capacity, len(bucket), capacity))
+
+    def plan(self, start: Optional[datetime] = None) -> List[schemas.PlannedSession]:
+        start = start or self.rules.inizio or pendulum.now(tz=DEFAULT_TIMEZONE).replace(second=0, microsecond=0)
+        duration = timedelta(minutes=self.rules.durata_sessione_minuti)
+        slot = duration + timedelta(minutes=self.rules.cambio_minuti)
+
+        ordered_sessions = heapq.merge(
+            *[[(key, session) for session in sessions] for key, sessions in self._sessions.items()],
+            key=lambda keyed_session: keyed_session[1][0].position,
+        )
+
+        planned: List[schemas.PlannedSession] = []
+        for slot_index, ((attivita, minorenni), session) in enumerate(ordered_sessions):
+            session_start: datetime = start + slot * slot_index
+            planned.append(schemas.PlannedSession(
+                nome=session_name(attivita, minorenni, session_start),
+                attivita=attivita,
+                minorenni=minorenni,
+                inizio=session_start,
+                fine=session_start + duration,
+                user_ids=[member.user_id for member in session],
+            ))
+
+        return planned
+
+
+def to_group_assignments(planned: List[schemas.PlannedSession]) -> List[schemas.GroupAssignment]:
+    return [schemas.GroupAssignment(nome=session.nome, user_ids=session.user_ids) for session in planned]
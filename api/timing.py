@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from collections import deque
+from datetime import date, datetime
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import DataError, IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from database import crud, models, schemas
+from database.database import SessionLocal
+
+LAP_HISTORY_SIZE: int = 20
+MIN_LAP_SECONDS: float = 10.0
+FLUSH_INTERVAL_SECONDS: float = 1.0
+FLUSH_BATCH_SIZE: int = 5000
+MAX_PENDING_PASSINGS: int = 200_000
+
+logger = next(logging.getLogger(name) for name in logging.root.manager.loggerDict)
+
+
+class TransponderLaps:
+    __slots__ = ("group_id", "user_id", "last_passing", "laps", "lap_count", "best_lap")
+
+    def __init__(self, group_id: Optional[int], user_id: Optional[int]) -> None:
+        self.group_id: Optional[int] = group_id
+        self.user_id: Optional[int] = user_id
+        self.last_passing: Optional[datetime] = None
+        self.laps: Deque[float] = deque(maxlen=LAP_HISTORY_SIZE)
+        self.lap_count: int = 0
+        self.best_lap: Optional[float] = None
+
+    def add_passing(self, timestamp: datetime) -> None:
+        if self.last_passing is not None:
+            lap: float = (timestamp - self.last_passing).total_seconds()
+            if lap < MIN_LAP_SECONDS:
+                return
+            self.laps.append(lap)
+            self.lap_count += 1
+            self.best_lap = lap if self.best_lap is None else min(self.best_lap, lap)
+        self.last_passing = timestamp
+
+    def leaderboard_entry(self, transponder: str) -> schemas.LeaderboardEntry:
+        return schemas.LeaderboardEntry(
+            transponder=transponder,
+            user_id=self.user_id,
+            giri=self.lap_count,
+            miglior_giro=self.best_lap,
+            ultimo_giro=self.laps[-1] if self.laps else None,
+            media_giri_recenti=sum(self.laps) / len(self.laps) if self.laps else None,
+        )
+
+
+class LapTimer:
+    def __init__(self) -> None:
+        self._transponders: Dict[str, TransponderLaps] = {}
+        self._groups: Dict[int, List[str]] = {}
+        self._pending: Deque[Dict] = deque(maxlen=MAX_PENDING_PASSINGS)
+        self.dropped: int = 0
+
+    def activate_group(self, group_id: int, transponders: Dict[str, int]) -> None:
+        for transponder in self._groups.pop(group_id, []):
+            self._transponders.pop(transponder, None)
+
+        for transponder, user_id in transponders.items():
+            if previous := self._transponders.get(transponder):
+                self._groups[previous.group_id].remove(transponder)
+            self._transponders[transponder] = TransponderLaps(group_id, user_id)
+        self._groups[group_id] = list(transponders)
+
+    def record(self, passings: List[schemas.Passing]) -> int:
+        for passing in sorted(passings, key=lambda p: p.timestamp):
+            laps: Optional[TransponderLaps] = self._transponders.get(passing.transponder)
+            if laps:
+                laps.add_passing(passing.timestamp)
+
+            if len(self._pending) == self._pending.maxlen:
+                self.dropped += 1
+            self._pending.append({
+                models.LapPassing.transponder.name: passing.transponder,
+                models.LapPassing.group_id.name: laps.group_id if laps else None,
+                models.LapPassing.user_id.name: laps.user_id if laps else None,
+                models.LapPassing.data_passaggio.name: passing.timestamp,
+            })
+
+        return len(passings)
+
+    def leaderboard(self, group_id: int) -> List[schemas.LeaderboardEntry]:
+        entries: List[schemas.LeaderboardEntry] = [
+            self._transponders[transponder].leaderboard_entry(transponder)
+            for transponder in self._groups.get(group_id, [])
+        ]
+        return sorted(entries, key=lambda entry: (entry.miglior_giro is None, entry.miglior_giro or 0.0))
+
+    def drain(self, max_rows: int = FLUSH_BATCH_SIZE) -> List[Dict]:
+        return [self._pending.popleft() for _ in range(min(max_rows, len(self._pending)))]
+
+    def requeue(self, rows: List[Dict]) -> None:
+        overflow: int = max(0, len(self._pending) + len(rows) - self._pending.maxlen)
+        self.dropped += overflow
+        self._pending.extendleft(reversed(rows[overflow:]))
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+
+def write_passings(rows: List[Dict]) -> Tuple[List[Dict], List[Dict], Optional[Exception]]:
+    rejected: List[Dict] = []
+    batches: List[List[Dict]] = [rows]
+    with SessionLocal() as db:
+        while batches:
+            batch: List[Dict] = batches.pop()
+            try:
+                crud.add_lap_passings(db, batch)
+            except (DataError, IntegrityError):
+                db.rollback()
+                if len(batch) == 1:
+                    rejected.extend(batch)
+                else:
+                    batches.extend([batch[len(batch) // 2:], batch[:len(batch) // 2]])
+            except Exception as e:
+                db.rollback()
+                return rejected, batch + [row for pending in reversed(batches) for row in pending], e
+    return rejected, [], None
+
+
+async def flush_periodically(timer: LapTimer) -> None:
+    dropped: int = 0
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+        if timer.dropped > dropped:
+            logger.warning(f"dropped {timer.dropped - dropped} oldest lap passings, pending queue full")
+            dropped = timer.dropped
+
+        while rows := timer.drain():
+            rejected, unwritten, error = await run_in_threadpool(write_passings, rows)
+            if rejected:
+                logger.warning(f"dropped {len(rejected)} lap passings refused by the database: {rejected[:5]}")
+            if unwritten:
+                logger.warning(f"failed to write {len(unwritten)} lap passings, retrying later: {error}")
+                timer.requeue(unwritten)
+                break
+
+
+def load_group_transponders(group_id: int, day: Optional[date] = None) -> Dict[str, int]:
+    with SessionLocal() as db:
+        return crud.get_group_transponders(db, group_id, day)
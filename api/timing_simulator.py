@@ -0,0 +1,95 @@
+import argparse
+import csv
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+import pendulum
+import requests
+
+API_BASE_URL: str = "http://localhost:8000"
+DEFAULT_TIMEZONE: str = "Europe/Rome"
+
+HEADERS = {
+    "accept": "application/json",
+    "Content-Type": "application/json",
+}
+
+
+def read_recorded_passings(path: str) -> Iterator[Dict[str, str]]:
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            yield {"transponder": row["transponder"], "timestamp": row["timestamp"]}
+
+
+def generate_passings(transponders: List[str], laps: int, lap_seconds: float, seed: int = 0) \
+        -> Iterator[Dict[str, str]]:
+    rng = random.Random(seed)
+    start: datetime = pendulum.now(tz=DEFAULT_TIMEZONE)
+    passings: List[Dict[str, str]] = []
+    for transponder in transponders:
+        timestamp: datetime = start + timedelta(seconds=rng.uniform(0, lap_seconds))
+        for _ in range(laps + 1):
+            passings.append({"transponder": transponder, "timestamp": timestamp.isoformat()})
+            timestamp += timedelta(seconds=rng.gauss(lap_seconds, lap_seconds * 0.05))
+
+    yield from sorted(passings, key=lambda passing: passing["timestamp"])
+
+
+def replay(passings: Iterator[Dict[str, str]], api_url: str, speed: float, batch_size: int) -> int:
+    sent: int = 0
+    batch: List[Dict[str, str]] = []
+    first_passing: datetime | None = None
+    replay_start: float = time.monotonic()
+
+    for passing in passings:
+        timestamp: datetime = datetime.fromisoformat(passing["timestamp"])
+        first_passing = first_passing or timestamp
+        if speed > 0:
+            delay: float = (timestamp - first_passing).total_seconds() / speed - (time.monotonic() - replay_start)
+            if delay > 0:
+                sent += send_batch(batch, api_url)
+                batch = []
+                time.sleep(delay)
+
+        batch.append(passing)
+        if len(batch) >= batch_size:
+            sent += send_batch(batch, api_url)
+            batch = []
+
+    return sent + send_batch(batch, api_url)
+
+
+def send_batch(batch: List[Dict[str, str]], api_url: str) -> int:
+    if not batch:
+        return 0
+    response = requests.post(f"{api_url}/timing/passings", json=batch, headers=HEADERS, timeout=5)
+    response.raise_for_status()
+    return len(batch)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Simulatore del loop di cronometraggio: riproduce i passaggi")
+    parser.add_argument("--recorded", help="CSV con colonne transponder,timestamp")
+    parser.add_argument("--transponders", nargs="*", default=[], help="Transponder da simulare senza CSV")
+    parser.add_argument("--laps", type=int, default=10)
+    parser.add_argument("--lap-seconds", type=float, default=45.0)
+    parser.add_argument("--speed", type=float, default=1.0, help="Moltiplicatore di velocita', 0 = senza attese")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--api-url", default=API_BASE_URL)
+    args = parser.parse_args()
+
+    if args.recorded:
+        passings = read_recorded_passings(args.recorded)
+    else:
+        passings = generate_passings(args.transponders, args.laps, args.lap_seconds)
+
+    start: float = time.monotonic()
+    sent: int = replay(passings, args.api_url, args.speed, args.batch_size)
+    elapsed: float = time.monotonic() - start
+    print(f"sent {sent} passings in {elapsed:.2f}s ({sent / max(elapsed, 1e-9):.0f}/s)")
+
+
+if __name__ == "__main__":
+    main()
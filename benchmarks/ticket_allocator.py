@@ -0,0 +1,79 @@
+import argparse
+import statistics
+import threading
+import time
+from collections import Counter
+from typing import List
+
+import pendulum
+
+from database import crud, models
+from database.database import SessionLocal, engine
+
+
+def allocate_worker(allocations: int, batch_size: int, day: pendulum.Date, tickets: List[int],
+                    latencies: List[float], barrier: threading.Barrier) -> None:
+    db = SessionLocal()
+    try:
+        barrier.wait()
+        for _ in range(allocations):
+            start: float = time.perf_counter()
+            allocated: List[int] = crud.allocate_tickets(db, count=batch_size, day=day)
+            db.commit()
+            latencies.append(time.perf_counter() - start)
+            tickets.extend(allocated)
+    finally:
+        db.close()
+
+
+def run(workers: int, allocations: int, batch_size: int) -> None:
+    models.Base.metadata.create_all(bind=engine)
+    day: pendulum.Date = pendulum.date(1970, 1, 1)
+    with SessionLocal() as db:
+        db.query(models.TicketCounter).filter(models.TicketCounter.giorno == day).delete()
+        db.commit()
+
+    tickets: List[int] = []
+    latencies: List[float] = []
+    barrier = threading.Barrier(workers)
+    threads: List[threading.Thread] = [
+        threading.Thread(target=allocate_worker, args=(allocations, batch_size, day, tickets, latencies, barrier))
+        for _ in range(workers)
+    ]
+
+    start: float = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed: float = time.perf_counter() - start
+
+    expected: int = workers * allocations * batch_size
+    per_ticket: Counter = Counter(tickets)
+    cycles: int = -(-expected // crud.MAX_TICKET_ID)
+    duplicates: int = sum(1 for count in per_ticket.values() if count > cycles)
+
+    with SessionLocal() as db:
+        db.query(models.TicketCounter).filter(models.TicketCounter.giorno == day).delete()
+        db.commit()
+
+    latencies.sort()
+    print(f"workers={workers} allocations={allocations} batch_size={batch_size}")
+    print(f"tickets allocated {len(tickets)}/{expected}, over-allocated ticket numbers: {duplicates}")
+    print(f"throughput {len(tickets) / elapsed:.0f} tickets/s, {len(latencies) / elapsed:.0f} allocations/s")
+    print(f"latency median {statistics.median(latencies) * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark di contesa dell'allocatore dei ticket")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--allocations", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1)
+    args = parser.parse_args()
+
+    run(args.workers, args.allocations, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
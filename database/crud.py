@@ -1,12 +1,16 @@
 import logging
-from typing import Any, List, Type
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple, Type
 
 import pendulum
+from sqlalchemy import ColumnElement, Row, and_, bindparam, delete, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.orm import Session
 
 from database import models, schemas
 
 DEFAULT_TIMEZONE: str = "Europe/Rome"
+MAX_TICKET_ID: int = 100
 
 logger = next(logging.getLogger(name) for name in logging.root.manager.loggerDict)
 
@@ -26,16 +30,45 @@ def get_user_by_id(db: Session, user_id: int) -> Type[schemas.User]:
     return db.query(models.User).filter(models.User.id == user_id).first()
 
 
+def get_users_by_ids(db: Session, user_ids: List[int]) -> List[Type[schemas.User]]:
+    return db.query(models.User).filter(models.User.id.in_(user_ids)).all()
+
+
 def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[Type[schemas.User]]:
-    return db.query(models.User).offset(skip).limit(limit).all()
+    return db.query(models.User).order_by(models.User.id).offset(skip).limit(limit).all()
 
 
-def add_user(db: Session, user: schemas.UserCreate) -> Type[schemas.User]:
+def get_user_version(db: Session, codice_fiscale: str) -> Optional[Tuple[int, datetime]]:
+    return db.execute(
+        select(models.User.id, models.User.data_modifica)
+        .where(models.User.codice_fiscale == codice_fiscale.upper()),
+    ).first()
+
+
+def get_users_version(db: Session, skip: int = 0, limit: int = 100) -> Tuple[int, int, Optional[datetime]]:
+    page = select(models.User.id, models.User.data_modifica).order_by(models.User.id).offset(skip).limit(limit) \
+        .subquery()
+    return db.execute(
+        select(func.count(), func.coalesce(func.sum(page.c.id), 0), func.max(page.c.data_modifica)),
+    ).one()
+
+
+def get_or_add_user(db: Session, user: schemas.UserCreate) -> Tuple[Type[schemas.User], bool]:
     if user_db := get_user_by_codice_fiscale(db, user.codice_fiscale.upper()):
-        return user_db
+        return user_db, False
 
     db_user = models.User(**user.model_dump())
-    return add_object(db, db_user)
+    return add_object(db, db_user), True
+
+
+def add_user(db: Session, user: schemas.UserCreate) -> Type[schemas.User]:
+    return get_or_add_user(db, user)[0]
+
+
+def get_child_link(db: Session, child_id: int, parent_id: int) -> Optional[models.Child]:
+    return db.query(models.Child) \
+        .filter(models.Child.id_figlio == child_id, models.Child.id_genitore == parent_id) \
+        .first()
 
 
 def add_child(db: Session, child: schemas.UserCreate, parent_id: int) -> schemas.User:
@@ -44,18 +77,20 @@ def add_child(db: Session, child: schemas.UserCreate, parent_id: int) -> schemas
         db_child = models.User(**child.model_dump())
         db_child = add_object(db, db_child)
 
-    child_user = models.Child(**{
-        models.Child.id_figlio: db_child.id,
-        models.Child.id_genitore: parent_id,
-    })
-
-    add_object(db, child_user)
+    if not get_child_link(db, db_child.id, parent_id):
+        child_user = models.Child(**{
+            models.Child.id_figlio.name: db_child.id,
+            models.Child.id_genitore.name: parent_id,
+        })
+        add_object(db, child_user)
 
     return db_child
 
 
-def add_children(db: Session, children: List[schemas.UserCreate], parent_id: int) -> List[int]:
+def add_children(db: Session, children: List[schemas.UserCreate], parent_id: int) \
+        -> Tuple[List[int], List[Type[schemas.User]]]:
     children_ids: List[int] = []
+    added_children: List[Type[schemas.User]] = []
 
     for child in children:
         db_child = get_user_by_codice_fiscale(db, child.codice_fiscale)
@@ -66,60 +101,189 @@ def add_children(db: Session, children: List[schemas.UserCreate], parent_id: int
 
         children_ids.append(db_child.id)
 
+        if get_child_link(db, db_child.id, parent_id):
+            continue
+
         child_user = models.Child(**{
             models.Child.id_figlio.name: db_child.id,
             models.Child.id_genitore.name: parent_id,
         })
         add_object(db, child_user)
+        added_children.append(db_child)
 
-    return children_ids
+    return children_ids, added_children
 
 
-def remove_children_by_id(db: Session, children_ids: List[int]):
-    for child_id in children_ids:
-        if result := db.query(models.User).filter(models.User.id == child_id).first():
-            db.delete(result)
-            db.commit()
+def tombstone_key(row: Row) -> Dict[str, Any]:
+    return {name: value.isoformat() if isinstance(value, date) else value for name, value in row._asdict().items()}
 
 
-def remove_child_by_id(db: Session, child_id: int):
-    if result := db.query(models.User).filter(models.User.id == child_id).first():
-        db.delete(result)
-        db.commit()
+def delete_returning_keys(db: Session, model: Any, condition: ColumnElement) -> List[Row]:
+    statement = delete(model) \
+        .where(condition) \
+        .returning(*model.__table__.primary_key.columns) \
+        .execution_options(synchronize_session=False)
+    rows: List[Row] = db.execute(statement).all()
+    if rows:
+        db.execute(insert(models.Tombstone), [
+            {models.Tombstone.tabella.name: model.__tablename__, models.Tombstone.chiave.name: tombstone_key(row)}
+            for row in rows
+        ])
+    return rows
 
 
-def add_group(db: Session, users: List[schemas.User], group_name: str, ticket_id: int) -> schemas.Group:
-    now: pendulum.datetime = pendulum.now(tz=DEFAULT_TIMEZONE)
+def remove_children_by_id(db: Session, children_ids: List[int]) -> List[int]:
+    if not children_ids:
+        return []
 
-    if ticket_id > 100:
-        ticket_id %= 101
-
-    db_group = models.Group(**{
-        models.Group.id_ticket.name: ticket_id,
-        models.Group.data_assegnazione.name: now,
-        models.Group.nome.name: group_name,
-    })
-    db.add(db_group)
+    delete_returning_keys(db, models.Child, or_(models.Child.id_figlio.in_(children_ids),
+                                                models.Child.id_genitore.in_(children_ids)))
+    delete_returning_keys(db, models.UserGroup, models.UserGroup.user_id.in_(children_ids))
+    removed_ids: List[int] = [row.id for row in delete_returning_keys(db, models.User,
+                                                                      models.User.id.in_(children_ids))]
     db.commit()
-    db.refresh(db_group)
+    return removed_ids
+
+
+def remove_child_by_id(db: Session, child_id: int) -> bool:
+    return bool(remove_children_by_id(db, [child_id]))
+
+
+def wrap_ticket_id(ticket_id: int) -> int:
+    return (ticket_id - 1) % MAX_TICKET_ID + 1
+
+
+def allocate_tickets(db: Session, count: int = 1, day: Optional[date] = None) -> List[int]:
+    day = day or pendulum.today(tz=DEFAULT_TIMEZONE).date()
+    statement = insert(models.TicketCounter) \
+        .values(**{models.TicketCounter.giorno.name: day, models.TicketCounter.ultimo_ticket.name: count}) \
+        .on_conflict_do_update(
+            index_elements=[models.TicketCounter.giorno],
+            set_={models.TicketCounter.ultimo_ticket.name: models.TicketCounter.ultimo_ticket + count},
+        ) \
+        .returning(models.TicketCounter.ultimo_ticket)
+    last_ticket: int = db.execute(statement).scalar_one()
+
+    return [wrap_ticket_id(ticket_id) for ticket_id in range(last_ticket - count + 1, last_ticket + 1)]
+
 
-    for user in users:
-        db_user_group = models.UserGroup(**{
+def _insert_groups(db: Session, groups: List[schemas.GroupAssignment], ticket_ids: List[int],
+                   now: pendulum.DateTime) -> List[models.Group]:
+    db_groups: List[models.Group] = [
+        models.Group(**{
+            models.Group.id_ticket.name: ticket_id,
+            models.Group.data_assegnazione.name: now,
+            models.Group.nome.name: group.nome,
+        })
+        for group, ticket_id in zip(groups, ticket_ids)
+    ]
+    db.add_all(db_groups)
+    db.flush()
+
+    user_groups: List[Dict[str, Any]] = [
+        {
             models.UserGroup.group_id.name: db_group.id,
-            models.UserGroup.user_id.name: user.id,
+            models.UserGroup.user_id.name: user_id,
             models.UserGroup.assignment_date.name: now,
-        },
-                                         )
-        add_object(db, db_user_group)
+        }
+        for db_group, group in zip(db_groups, groups)
+        for user_id in group.user_ids
+    ]
+    if user_groups:
+        db.execute(insert(models.UserGroup), user_groups)
+
+    return db_groups
+
+
+def add_group(db: Session, users: List[schemas.User], group_name: str) -> schemas.Group:
+    now: pendulum.datetime = pendulum.now(tz=DEFAULT_TIMEZONE)
+
+    ticket_id: int = allocate_tickets(db, day=now.date())[0]
+    group = schemas.GroupAssignment(nome=group_name, user_ids=[user.id for user in users])
+
+    db_group = _insert_groups(db, [group], [ticket_id], now)[0]
+    db.commit()
+    db.refresh(db_group)
 
     return db_group
 
 
-def update_user(db: Session, user: schemas.UserBase) -> Type[models.User]:
-    db_user = get_user_by_codice_fiscale(db, user.codice_fiscale.upper())
-    if not db_user:
-        raise Exception("User not present in the db")
+def add_groups(db: Session, groups: List[schemas.GroupAssignment]) -> List[schemas.Group]:
+    if not groups:
+        return []
+
+    now: pendulum.datetime = pendulum.now(tz=DEFAULT_TIMEZONE)
+    ticket_ids: List[int] = allocate_tickets(db, count=len(groups), day=now.date())
+
+    db_groups: List[models.Group] = _insert_groups(db, groups, ticket_ids, now)
+    db.commit()
+    for db_group in db_groups:
+        db.refresh(db_group)
+
+    return db_groups
+
+
+def assigned_on(column: Any, day: Optional[date] = None) -> ColumnElement:
+    day = day or pendulum.today(tz=DEFAULT_TIMEZONE).date()
+    start: pendulum.DateTime = pendulum.datetime(day.year, day.month, day.day, tz=DEFAULT_TIMEZONE)
+    return and_(column >= start, column < start.add(days=1))
+
+
+def get_group_by_id(db: Session, group_id: int, day: Optional[date] = None) -> Type[schemas.Group]:
+    return db.query(models.Group) \
+        .filter(models.Group.id == group_id, assigned_on(models.Group.data_assegnazione, day)) \
+        .first()
+
+
+def get_group_version(db: Session, group_id: int, day: Optional[date] = None) -> Optional[Tuple[int, datetime]]:
+    return db.execute(
+        select(models.Group.id, models.Group.data_modifica)
+        .where(models.Group.id == group_id, assigned_on(models.Group.data_assegnazione, day)),
+    ).first()
+
+
+def get_groups_by_day(db: Session, day: date) -> List[Type[schemas.Group]]:
+    return db.query(models.Group) \
+        .filter(assigned_on(models.Group.data_assegnazione, day)) \
+        .order_by(models.Group.id) \
+        .all()
+
+
+def get_groups_by_day_version(db: Session, day: date) -> Tuple[int, int, Optional[datetime]]:
+    return db.execute(
+        select(func.count(), func.coalesce(func.sum(models.Group.id), 0), func.max(models.Group.data_modifica))
+        .where(assigned_on(models.Group.data_assegnazione, day)),
+    ).one()
+
+
+def assign_transponders(db: Session, group_id: int, transponders: Dict[int, str], day: Optional[date] = None) -> int:
+    statement = update(models.UserGroup) \
+        .where(models.UserGroup.group_id == group_id, models.UserGroup.user_id == bindparam("b_user_id"),
+               assigned_on(models.UserGroup.assignment_date, day)) \
+        .values(**{models.UserGroup.transponder.name: bindparam("b_transponder")})
+    updated: int = db.connection().execute(statement, [
+        {"b_user_id": user_id, "b_transponder": transponder} for user_id, transponder in transponders.items()
+    ]).rowcount
+    db.commit()
+    return updated
+
+
+def get_group_transponders(db: Session, group_id: int, day: Optional[date] = None) -> Dict[str, int]:
+    rows = db.execute(
+        select(models.UserGroup.transponder, models.UserGroup.user_id)
+        .where(models.UserGroup.group_id == group_id, models.UserGroup.transponder.is_not(None),
+               assigned_on(models.UserGroup.assignment_date, day)),
+    ).all()
+    return {transponder: user_id for transponder, user_id in rows}
 
+
+def add_lap_passings(db: Session, passings: List[Dict[str, Any]]) -> None:
+    if passings:
+        db.execute(insert(models.LapPassing), passings)
+        db.commit()
+
+
+def update_user(db: Session, user: schemas.UserBase) -> Row:
     update_dict = {
         models.User.codice_fiscale.name: user.codice_fiscale.upper(),
         models.User.nome.name: user.nome,
@@ -128,24 +292,112 @@ def update_user(db: Session, user: schemas.UserBase) -> Type[models.User]:
         models.User.luogo_nascita.name: user.luogo_nascita,
         models.User.luogo_residenza.name: user.luogo_residenza,
         models.User.via_residenza.name: user.via_residenza,
+        models.User.codice_luogo_nascita.name: user.codice_luogo_nascita,
+        models.User.codice_luogo_residenza.name: user.codice_luogo_residenza,
         models.User.telefono.name: user.telefono,
         models.User.data_registrazione.name: pendulum.today(tz=DEFAULT_TIMEZONE).date(),
     }
-    matched_rows: int = db.query(models.User).filter(models.User.id == db_user.id).update(update_dict)
+    statement = update(models.User) \
+        .where(models.User.codice_fiscale == user.codice_fiscale.upper()) \
+        .values(update_dict) \
+        .returning(*models.User.__table__.columns) \
+        .execution_options(synchronize_session=False)
+    rows: List[Row] = db.execute(statement).all()
+
+    if len(rows) != 1:
+        db.rollback()
+        raise Exception("User not present in the db" if not rows else
+                        f"Error while updating user {user.nome} {user.cognome}: {len(rows)} matching rows")
     db.commit()
-    db.refresh(db_user)
+    return rows[0]
+
 
-    if matched_rows == 1:
-        return db_user
-    else:
-        raise Exception(f"Error while updating user {db_user.nome} {db_user.cognome}")
+def _renew_users_where(db: Session, condition: ColumnElement) -> List[Row]:
+    statement = update(models.User) \
+        .where(condition) \
+        .values({models.User.data_registrazione.name: pendulum.today(tz=DEFAULT_TIMEZONE).date()}) \
+        .returning(*models.User.__table__.columns) \
+        .execution_options(synchronize_session=False)
+    rows: List[Row] = db.execute(statement).all()
+    db.commit()
+    return rows
+
+
+def renew_users(db: Session, fiscal_codes: List[str]) -> List[Row]:
+    return _renew_users_where(db, models.User.codice_fiscale.in_([code.upper() for code in fiscal_codes]))
+
+
+def renew_family(db: Session, parent_id: int) -> List[Row]:
+    children_ids = select(models.Child.id_figlio).where(models.Child.id_genitore == parent_id)
+    return _renew_users_where(db, or_(models.User.id == parent_id, models.User.id.in_(children_ids)))
 
 
 def renew_user(db: Session, fiscal_code: str) -> bool:
-    db_user = get_user_by_codice_fiscale(db, fiscal_code)
-    if not db_user:
+    if not renew_users(db, [fiscal_code]):
         raise Exception("User not present in the db")
+    return True
+
+
+def get_gate_version(db: Session) -> Tuple[int, Optional[datetime], Optional[datetime]]:
+    last_deleted = select(func.max(models.Tombstone.data_cancellazione)) \
+        .where(models.Tombstone.tabella == models.User.__tablename__) \
+        .scalar_subquery()
+    return db.execute(select(func.count(models.User.id), func.max(models.User.data_modifica), last_deleted)).one()
+
+
+def get_gate_members(db: Session, changed_since: Optional[datetime] = None, registered_since: Optional[date] = None) \
+        -> List[Row]:
+    query = select(models.User.codice_fiscale, models.User.data_registrazione, models.User.data_nascita)
+    if changed_since is not None:
+        query = query.where(models.User.data_modifica >= changed_since)
+    if registered_since is not None:
+        query = query.where(models.User.data_registrazione >= registered_since)
+    return db.execute(query.execution_options(yield_per=10_000)).all()
+
+
+def count_user_tombstones(db: Session, deleted_after: datetime) -> int:
+    return db.execute(
+        select(func.count())
+        .where(models.Tombstone.tabella == models.User.__tablename__,
+               models.Tombstone.data_cancellazione > deleted_after),
+    ).scalar_one()
+
+
+def claim_idempotency_key(db: Session, key: str, fingerprint: str, ttl: timedelta) -> bool:
+    db.query(models.IdempotencyKey) \
+        .filter(models.IdempotencyKey.chiave == key, models.IdempotencyKey.data_creazione < func.now() - ttl) \
+        .delete(synchronize_session=False)
+    statement = insert(models.IdempotencyKey) \
+        .values(**{models.IdempotencyKey.chiave.name: key, models.IdempotencyKey.impronta.name: fingerprint}) \
+        .on_conflict_do_nothing(index_elements=[models.IdempotencyKey.chiave]) \
+        .returning(models.IdempotencyKey.chiave)
+    claimed: bool = db.execute(statement).scalar_one_or_none() is not None
+    db.commit()
+    return claimed
 
-    update_dict = {schemas.User.data_registrazione: pendulum.now(tz=DEFAULT_TIMEZONE)}
 
-    return db.query(models.User).filter(models.User.codice_fiscale == db_user.codice_fiscale).update(update_dict) == 1
+def get_idempotency_key(db: Session, key: str) -> Optional[models.IdempotencyKey]:
+    return db.query(models.IdempotencyKey).filter(models.IdempotencyKey.chiave == key).first()
+
+
+def complete_idempotency_key(db: Session, key: str, status_code: int, content_type: Optional[str],
+                             body: bytes) -> None:
+    db.query(models.IdempotencyKey).filter(models.IdempotencyKey.chiave == key).update({
+        models.IdempotencyKey.status_code.name: status_code,
+        models.IdempotencyKey.content_type.name: content_type,
+        models.IdempotencyKey.risposta.name: body,
+    })
+    db.commit()
+
+
+def release_idempotency_key(db: Session, key: str) -> None:
+    db.query(models.IdempotencyKey).filter(models.IdempotencyKey.chiave == key).delete()
+    db.commit()
+
+
+def prune_idempotency_keys(db: Session, ttl: timedelta) -> int:
+    deleted: int = db.query(models.IdempotencyKey) \
+        .filter(models.IdempotencyKey.data_creazione < func.now() - ttl) \
+        .delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -1,21 +1,119 @@
+import itertools
+import threading
+import time
 from datetime import datetime, timezone
+from typing import Dict, List, Optional
 
 import sqlalchemy.engine
 import tomli
 from sqlalchemy import (
     create_engine,
+    event,
+    text,
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 with open("data/secrets.toml", "rb") as f:
     config = tomli.load(f)["database"]
 
-DATABASE_URL: str = f"postgresql://{config['user']}:{config['password']}@db:5432/{config['database']}"
+DATABASE_URL: str = config.get("url") or \
+                    f"postgresql://{config['user']}:{config['password']}@db:5432/{config['database']}"
+REPLICA_URLS: List[str] = config.get("replica_urls", [])
+MAX_REPLICA_LAG_SECONDS: float = config.get("max_replica_lag_seconds", 5.0)
+REPLICA_LAG_CHECK_SECONDS: float = config.get("replica_lag_check_seconds", 10.0)
+READ_YOUR_WRITES_SECONDS: float = config.get("read_your_writes_seconds", 15.0)
+REPLICA_CONNECT_TIMEOUT_SECONDS: int = config.get("replica_connect_timeout_seconds", 2)
+REPLICA_LAG_QUERY: str = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
 local_timezone: datetime.tzinfo = datetime.now(timezone.utc).astimezone().tzinfo
 
+
+def replica_connect_args(url: str) -> Dict[str, int]:
+    if not url.startswith("postgresql"):
+        return {}
+    return {"connect_timeout": REPLICA_CONNECT_TIMEOUT_SECONDS}
+
+
 # Create a SQLAlchemy engine and session
 engine: sqlalchemy.engine.Engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+replica_engines: List[sqlalchemy.engine.Engine] = [
+    create_engine(url, pool_pre_ping=True, connect_args=replica_connect_args(url)) for url in REPLICA_URLS
+]
 SessionLocal = sessionmaker(bind=engine, autoflush=False)
 
 Base = declarative_base()
+
+_replica_lag: Dict[int, float] = {}
+_replica_lag_checked_at: Dict[int, float] = {}
+_replica_lock = threading.Lock()
+_replica_round_robin = itertools.count()
+_recent_writes: Dict[str, float] = {}
+
+
+def replica_lag_seconds(replica: sqlalchemy.engine.Engine) -> float:
+    if replica.dialect.name != "postgresql":
+        return 0.0
+    with replica.connect() as connection:
+        return float(connection.execute(text(REPLICA_LAG_QUERY)).scalar() or 0.0)
+
+
+def cached_replica_lag(index: int) -> float:
+    now: float = time.monotonic()
+    with _replica_lock:
+        if now - _replica_lag_checked_at.get(index, float("-inf")) < REPLICA_LAG_CHECK_SECONDS:
+            return _replica_lag[index]
+        _replica_lag_checked_at[index] = now
+        _replica_lag.setdefault(index, float("inf"))
+
+    try:
+        lag: float = replica_lag_seconds(replica_engines[index])
+    except Exception:
+        lag = float("inf")
+
+    with _replica_lock:
+        _replica_lag[index] = lag
+    return lag
+
+
+def healthy_replicas() -> List[sqlalchemy.engine.Engine]:
+    return [replica for index, replica in enumerate(replica_engines)
+            if cached_replica_lag(index) <= MAX_REPLICA_LAG_SECONDS]
+
+
+def get_read_engine() -> sqlalchemy.engine.Engine:
+    if not (replicas := healthy_replicas()):
+        return engine
+    return replicas[next(_replica_round_robin) % len(replicas)]
+
+
+def mark_recent_write(client_id: Optional[str]) -> None:
+    if not client_id:
+        return
+    now: float = time.monotonic()
+    with _replica_lock:
+        _recent_writes[client_id] = now
+        for client, written_at in list(_recent_writes.items()):
+            if now - written_at > READ_YOUR_WRITES_SECONDS:
+                del _recent_writes[client]
+
+
+def wrote_recently(client_id: Optional[str]) -> bool:
+    if not client_id:
+        return False
+    return time.monotonic() - _recent_writes.get(client_id, float("-inf")) <= READ_YOUR_WRITES_SECONDS
+
+
+def create_read_session(client_id: Optional[str] = None, force_primary: bool = False) -> Session:
+    use_primary: bool = force_primary or not replica_engines or wrote_recently(client_id)
+    return SessionLocal(bind=engine if use_primary else get_read_engine(), info={"read_only": True})
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def track_commit(session: Session) -> None:
+    if not session.info.get("read_only"):
+        mark_recent_write(session.info.get("client_id"))
@@ -0,0 +1,172 @@
+import argparse
+import csv
+import io
+import zlib
+from datetime import date
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import BigInteger, Column, Date, DateTime, Integer, Select, Table, func, select
+from sqlalchemy.orm import Session, aliased
+
+from database import models
+from database.database import SessionLocal
+
+EXPORT_CHUNK_SIZE: int = 2000
+EXPORT_FORMATS: List[str] = ["csv", "parquet"]
+
+USER_EXPORT_COLUMNS: List[str] = [
+    models.User.id.name,
+    models.User.codice_fiscale.name,
+    models.User.nome.name,
+    models.User.cognome.name,
+    models.User.data_nascita.name,
+    models.User.luogo_nascita.name,
+    models.User.luogo_residenza.name,
+    models.User.via_residenza.name,
+    models.User.codice_luogo_nascita.name,
+    models.User.codice_luogo_residenza.name,
+    models.User.telefono.name,
+    models.User.tipo_utente.name,
+    models.User.attivita.name,
+    models.User.data_registrazione.name,
+]
+CHILDREN_EXPORT_COLUMNS: List[str] = ["codici_fiscali_genitori"]
+
+
+def export_columns(include_children: bool) -> List[str]:
+    return USER_EXPORT_COLUMNS + (CHILDREN_EXPORT_COLUMNS if include_children else [])
+
+
+def build_export_query(season: Optional[int] = None, include_children: bool = False) -> Select:
+    query: Select = select(*[models.User.__table__.c[column] for column in USER_EXPORT_COLUMNS])
+
+    if include_children:
+        parent = aliased(models.User)
+        parents_fiscal_codes = select(func.string_agg(parent.codice_fiscale, ",")) \
+            .join(models.Child, models.Child.id_genitore == parent.id) \
+            .where(models.Child.id_figlio == models.User.id) \
+            .scalar_subquery()
+        query = query.add_columns(parents_fiscal_codes.label(CHILDREN_EXPORT_COLUMNS[0]))
+
+    if season:
+        query = query.where(models.User.data_registrazione >= date(season, 1, 1),
+                            models.User.data_registrazione < date(season + 1, 1, 1))
+
+    return query.order_by(models.User.id)
+
+
+def iter_export_chunks(db: Session, season: Optional[int] = None, include_children: bool = False,
+                       chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[List[Dict[str, Any]]]:
+    query: Select = build_export_query(season=season, include_children=include_children)
+    result = db.execute(query.execution_options(yield_per=chunk_size))
+    for partition in result.mappings().partitions():
+        yield [dict(row) for row in partition]
+
+
+def stream_csv_gzip(chunks: Iterable[List[Dict[str, Any]]], columns: List[str]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns)
+    writer.writeheader()
+
+    for chunk in chunks:
+        writer.writerows(chunk)
+        if compressed := compressor.compress(buffer.getvalue().encode("utf8")):
+            yield compressed
+        buffer.seek(0)
+        buffer.truncate()
+
+    yield compressor.compress(buffer.getvalue().encode("utf8")) + compressor.flush()
+
+
+class _StreamSink(io.RawIOBase):
+    def __init__(self) -> None:
+        super().__init__()
+        self._pending: List[bytes] = []
+        self._position: int = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: bytes) -> int:
+        self._pending.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data: bytes = b"".join(self._pending)
+        self._pending.clear()
+        return data
+
+
+def arrow_type(column: Column) -> pa.DataType:
+    if isinstance(column.type, BigInteger):
+        return pa.int64()
+    if isinstance(column.type, Integer):
+        return pa.int32()
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column.type, Date):
+        return pa.date32()
+    return pa.string()
+
+
+def parquet_schema(columns: List[str], table: Table = models.User.__table__) -> pa.Schema:
+    return pa.schema([
+        (column, arrow_type(table.c[column]) if column in table.c else pa.string()) for column in columns
+    ])
+
+
+def stream_parquet(chunks: Iterable[List[Dict[str, Any]]], columns: List[str],
+                   compression: str = "zstd") -> Iterator[bytes]:
+    schema = parquet_schema(columns)
+    sink = _StreamSink()
+    with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+            if data := sink.drain():
+                yield data
+    yield sink.drain()
+
+
+def stream_export(chunks: Iterable[List[Dict[str, Any]]], export_format: str, include_children: bool) \
+        -> Iterator[bytes]:
+    columns: List[str] = export_columns(include_children)
+    if export_format == "parquet":
+        return stream_parquet(chunks, columns)
+    if export_format == "csv":
+        return stream_csv_gzip(chunks, columns)
+    raise ValueError(f"Unsupported export format {export_format}, use one of {EXPORT_FORMATS}")
+
+
+def export_file_name(export_format: str, season: Optional[int] = None) -> str:
+    suffix: str = "parquet" if export_format == "parquet" else "csv.gz"
+    return f"libro_soci_{season or 'completo'}.{suffix}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Esporta il libro soci in CSV compresso o Parquet")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv")
+    parser.add_argument("--season", type=int, default=None, help="Anno di registrazione da esportare")
+    parser.add_argument("--children", action="store_true", help="Aggiunge i codici fiscali dei genitori")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    output: str = args.output or export_file_name(args.format, args.season)
+    db = SessionLocal()
+    try:
+        chunks = iter_export_chunks(db, season=args.season, include_children=args.children)
+        with open(output, "wb") as f:
+            for data in stream_export(chunks, args.format, args.children):
+                f.write(data)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import argparse
+import json
+import logging
+import os
+from datetime import date, datetime, timedelta
+from hashlib import sha1
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import JSON, Column, Date, DateTime, Select, Table, func, select, tuple_
+from sqlalchemy.orm import Session
+
+from database import export, models
+from database.database import create_read_session
+
+STORE_DIR: str = os.environ.get("ANALYTICS_STORE_DIR", "data/analytics")
+CHECKPOINT_FILE: str = "checkpoint.json"
+CHANGES_FILE_ROWS: int = 50_000
+SAFETY_LAG: timedelta = timedelta(minutes=5)
+
+logger = next(logging.getLogger(name) for name in logging.root.manager.loggerDict)
+
+
+class TrackedTable(NamedTuple):
+    table: Table
+    watermark: Column
+
+    @property
+    def key_columns(self) -> List[Column]:
+        return [self.watermark, *self.table.primary_key.columns]
+
+
+TRACKED_TABLES: Dict[str, TrackedTable] = {
+    tracked.table.name: tracked for tracked in [
+        TrackedTable(models.User.__table__, models.User.__table__.c.data_modifica),
+        TrackedTable(models.Child.__table__, models.Child.__table__.c.data_modifica),
+        TrackedTable(models.Group.__table__, models.Group.__table__.c.data_modifica),
+        TrackedTable(models.UserGroup.__table__, models.UserGroup.__table__.c.data_modifica),
+        TrackedTable(models.Tombstone.__table__, models.Tombstone.__table__.c.data_cancellazione),
+    ]
+}
+
+
+def load_checkpoint(store_dir: str = STORE_DIR) -> Dict[str, List[Any]]:
+    path: str = os.path.join(store_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(checkpoint: Dict[str, List[Any]], store_dir: str = STORE_DIR) -> None:
+    path: str = os.path.join(store_dir, CHECKPOINT_FILE)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def to_json_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, date) else value
+
+
+def from_json_value(column: Column, value: Any) -> Any:
+    if value is not None and isinstance(column.type, DateTime):
+        return datetime.fromisoformat(value)
+    if value is not None and isinstance(column.type, Date):
+        return date.fromisoformat(value)
+    return value
+
+
+def changes_query(tracked: TrackedTable, watermark: Optional[List[Any]], upper_bound: datetime) -> Select:
+    key_columns: List[Column] = tracked.key_columns
+    query: Select = select(tracked.table).where(tracked.watermark < upper_bound)
+    if watermark:
+        values: List[Any] = [from_json_value(column, value) for column, value in zip(key_columns, watermark)]
+        query = query.where(tuple_(*key_columns) > tuple_(*values))
+    return query.order_by(*key_columns)
+
+
+def to_arrow(tracked: TrackedTable, rows: List[Dict[str, Any]]) -> pa.Table:
+    columns: List[str] = [column.name for column in tracked.table.columns]
+    json_columns: List[str] = [column.name for column in tracked.table.columns if isinstance(column.type, JSON)]
+    for row in rows:
+        for column in json_columns:
+            row[column] = json.dumps(row[column])
+    return pa.Table.from_pylist(rows, schema=export.parquet_schema(columns, tracked.table))
+
+
+def write_changes_file(tracked: TrackedTable, rows: List[Dict[str, Any]], store_dir: str = STORE_DIR) -> str:
+    first_key: List[Any] = [to_json_value(rows[0][column.name]) for column in tracked.key_columns]
+    file_name: str = f"{rows[0][tracked.watermark.name]:%Y%m%dT%H%M%S%f}-" \
+                     f"{sha1(json.dumps(first_key).encode()).hexdigest()[:10]}.parquet"
+    table_dir: str = os.path.join(store_dir, tracked.table.name)
+    os.makedirs(table_dir, exist_ok=True)
+
+    path: str = os.path.join(table_dir, file_name)
+    pq.write_table(to_arrow(tracked, rows), f"{path}.tmp", compression="zstd")
+    os.replace(f"{path}.tmp", path)
+    return path
+
+
+def sync_table(db: Session, name: str, checkpoint: Dict[str, List[Any]], upper_bound: datetime,
+               store_dir: str = STORE_DIR) -> int:
+    tracked: TrackedTable = TRACKED_TABLES[name]
+    query: Select = changes_query(tracked, checkpoint.get(name), upper_bound)
+    result = db.execute(query.execution_options(yield_per=CHANGES_FILE_ROWS))
+
+    exported: int = 0
+    for partition in result.mappings().partitions():
+        rows: List[Dict[str, Any]] = [dict(row) for row in partition]
+        path: str = write_changes_file(tracked, rows, store_dir)
+        checkpoint[name] = [to_json_value(rows[-1][column.name]) for column in tracked.key_columns]
+        save_checkpoint(checkpoint, store_dir)
+        exported += len(rows)
+        logger.warning(f"exported {len(rows)} changed rows of {name} to {path}")
+    return exported
+
+
+def sync(store_dir: str = STORE_DIR, safety_lag: timedelta = SAFETY_LAG, tables: Optional[List[str]] = None) \
+        -> Dict[str, int]:
+    os.makedirs(store_dir, exist_ok=True)
+    checkpoint: Dict[str, List[Any]] = load_checkpoint(store_dir)
+    with create_read_session() as db:
+        upper_bound: datetime = db.execute(select(func.localtimestamp())).scalar_one() - safety_lag
+        return {name: sync_table(db, name, checkpoint, upper_bound, store_dir) for name in tables or TRACKED_TABLES}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Esporta in Parquet solo le righe modificate dall'ultimo checkpoint")
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    parser.add_argument("--lag-seconds", type=float, default=SAFETY_LAG.total_seconds(),
+                        help="Esclude le modifiche piu' recenti di questo intervallo, per le transazioni in corso")
+    parser.add_argument("--tables", nargs="*", choices=list(TRACKED_TABLES), default=None)
+    args = parser.parse_args()
+
+    exported: Dict[str, int] = sync(args.store_dir, timedelta(seconds=args.lag_seconds), args.tables)
+    print(", ".join(f"{name}: {rows}" for name, rows in exported.items()))
+
+
+if __name__ == "__main__":
+    main()
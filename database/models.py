@@ -2,12 +2,49 @@ import enum
 from datetime import datetime
 
 import pendulum
-from sqlalchemy import Column, Date, DateTime, Enum, ForeignKey, Index, Integer, String
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    Enum,
+    ForeignKey,
+    ForeignKeyConstraint,
+    Index,
+    Integer,
+    JSON,
+    LargeBinary,
+    PrimaryKeyConstraint,
+    String,
+    func,
+)
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import relationship
+from sqlalchemy.schema import CreateColumn
 
 from database.database import Base
 
 DEFAULT_TIMEZONE: str = "Europe/Rome"
+ROW_ID_TYPE: BigInteger = BigInteger().with_variant(Integer, "sqlite")
+
+
+def is_composite_autoincrement(column: Column) -> bool:
+    return column.primary_key and column.autoincrement is True and len(column.table.primary_key.columns) > 1
+
+
+@compiles(CreateColumn, "sqlite")
+def create_sqlite_column(element: CreateColumn, compiler, **kw) -> str:
+    column: Column = element.element
+    if is_composite_autoincrement(column):
+        return f"{compiler.preparer.format_column(column)} INTEGER NOT NULL"
+    return compiler.visit_create_column(element, **kw)
+
+
+@compiles(PrimaryKeyConstraint, "sqlite")
+def create_sqlite_primary_key(constraint: PrimaryKeyConstraint, compiler, **kw) -> str:
+    if autoincrement := [column for column in constraint.columns if is_composite_autoincrement(column)]:
+        return f"PRIMARY KEY ({compiler.preparer.format_column(autoincrement[0])})"
+    return compiler.visit_primary_key_constraint(constraint, **kw)
 
 
 class UserTypeEnum(enum.Enum):
@@ -26,6 +63,7 @@ class User(Base):
     __table_args__ = (
         Index("idx_codice_fiscale", "codice_fiscale"),
         Index("idx_name_surname", "nome", "cognome"),
+        Index("idx_users_modifica", "data_modifica", "id"),
     )
 
     id: Column = Column(Integer, primary_key=True, index=True, autoincrement=True)
@@ -35,23 +73,32 @@ class User(Base):
     luogo_nascita: Column = Column(String(100), nullable=True)
     luogo_residenza: Column = Column(String(100), nullable=True)
     via_residenza: Column = Column(String(100), nullable=True)
+    codice_luogo_nascita: Column = Column(String(4), nullable=True)
+    codice_luogo_residenza: Column = Column(String(4), index=True, nullable=True)
     codice_fiscale: Column = Column(String(16), index=True, nullable=False)
     telefono: Column = Column(String(30), nullable=True)
     tipo_utente: Column = Column(Enum("socio", "tesserato", name="tipo_utente_enum"), nullable=True,
                                  default="tesserato")
     attivita: Column = Column(Enum("kart", "moto", "altro", name="attivita_enum"), nullable=True, default="kart")
     data_registrazione: Column = Column(Date, default=datetime.today, nullable=False)
+    data_modifica: Column = Column(DateTime, default=func.now(), onupdate=func.now(), server_default=func.now(),
+                                   nullable=False)
 
     utente_gruppo_fk = relationship("UserGroup", back_populates="utente_gruppo")
 
 
 class Child(Base):
     __tablename__ = "children"
+    __table_args__ = (
+        Index("idx_children_modifica", "data_modifica", "id"),
+    )
 
     id: Column = Column(Integer, primary_key=True, index=True, autoincrement=True)
     id_genitore: Column = Column(Integer, ForeignKey("users.id", onupdate="CASCADE", ondelete="CASCADE"),
                                  nullable=False)
     id_figlio: Column = Column(Integer, ForeignKey("users.id", onupdate="CASCADE", ondelete="CASCADE"), nullable=False)
+    data_modifica: Column = Column(DateTime, default=func.now(), onupdate=func.now(), server_default=func.now(),
+                                   nullable=False)
 
     genitore = relationship("User", foreign_keys=[id_genitore])
     figlio = relationship("User", foreign_keys=[id_figlio])
@@ -62,22 +109,81 @@ class Group(Base):
     __table_args__ = (
         Index("idx_id", "id"),
         Index("idx_ticket_data", "id_ticket", "data_assegnazione"),
+        Index("idx_groups_modifica", "data_modifica", "id", "data_assegnazione"),
+        {"postgresql_partition_by": "RANGE (data_assegnazione)"},
     )
 
     id: Column = Column(Integer, primary_key=True, index=True, autoincrement=True)
     id_ticket: Column = Column(Integer, index=True)
     nome: Column = Column(String(50))
-    data_assegnazione: Column = Column(DateTime, default=pendulum.now(DEFAULT_TIMEZONE), index=True)
+    data_assegnazione: Column = Column(DateTime, primary_key=True, default=pendulum.now(DEFAULT_TIMEZONE), index=True)
+    data_modifica: Column = Column(DateTime, default=func.now(), onupdate=func.now(), server_default=func.now(),
+                                   nullable=False)
 
     gruppo = relationship("UserGroup", back_populates="gruppo_fk")
 
 
 class UserGroup(Base):
     __tablename__ = "user_groups"
-    group_id: Column = Column(Integer, ForeignKey("groups.id", onupdate="CASCADE", ondelete="CASCADE"),
-                              primary_key=True)
+    __table_args__ = (
+        ForeignKeyConstraint(["group_id", "assignment_date"], ["groups.id", "groups.data_assegnazione"],
+                             onupdate="CASCADE", ondelete="CASCADE"),
+        Index("idx_user_groups_modifica", "data_modifica", "group_id", "user_id", "assignment_date"),
+        {"postgresql_partition_by": "RANGE (assignment_date)"},
+    )
+
+    group_id: Column = Column(Integer, primary_key=True)
     user_id: Column = Column(Integer, ForeignKey("users.id", onupdate="CASCADE", ondelete="CASCADE"), primary_key=True)
-    assignment_date: Column = Column(DateTime, default=pendulum.now(tz=DEFAULT_TIMEZONE))
+    assignment_date: Column = Column(DateTime, primary_key=True, default=pendulum.now(tz=DEFAULT_TIMEZONE))
+    transponder: Column = Column(String(20), nullable=True)
+    data_modifica: Column = Column(DateTime, default=func.now(), onupdate=func.now(), server_default=func.now(),
+                                   nullable=False)
 
     gruppo_fk = relationship("Group", back_populates="gruppo")
     utente_gruppo = relationship("User", back_populates="utente_gruppo_fk")
+
+
+class TicketCounter(Base):
+    __tablename__ = "ticket_counters"
+
+    giorno: Column = Column(Date, primary_key=True)
+    ultimo_ticket: Column = Column(Integer, nullable=False, default=0)
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("idx_idempotency_data_creazione", "data_creazione"),
+    )
+
+    chiave: Column = Column(String(255), primary_key=True)
+    impronta: Column = Column(String(64), nullable=False)
+    status_code: Column = Column(Integer, nullable=True)
+    content_type: Column = Column(String(100), nullable=True)
+    risposta: Column = Column(LargeBinary, nullable=True)
+    data_creazione: Column = Column(DateTime, default=func.now(), nullable=False)
+
+
+class LapPassing(Base):
+    __tablename__ = "lap_passings"
+    __table_args__ = (
+        Index("idx_passing_group_data", "group_id", "data_passaggio"),
+    )
+
+    id: Column = Column(ROW_ID_TYPE, primary_key=True, autoincrement=True)
+    transponder: Column = Column(String(20), nullable=False)
+    group_id: Column = Column(Integer, nullable=True)
+    user_id: Column = Column(Integer, nullable=True)
+    data_passaggio: Column = Column(DateTime, nullable=False)
+
+
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+    __table_args__ = (
+        Index("idx_tombstones_data_cancellazione", "data_cancellazione", "id"),
+    )
+
+    id: Column = Column(ROW_ID_TYPE, primary_key=True, autoincrement=True)
+    tabella: Column = Column(String(50), nullable=False)
+    chiave: Column = Column(JSON, nullable=False)
+    data_cancellazione: Column = Column(DateTime, default=func.now(), server_default=func.now(), nullable=False)
@@ -0,0 +1,176 @@
+import argparse
+import gzip
+import logging
+import os
+from datetime import date
+from typing import List, Optional, Tuple
+
+import pendulum
+import sqlalchemy.engine
+from sqlalchemy import text
+
+from database import models
+from database.database import engine
+
+DEFAULT_TIMEZONE: str = "Europe/Rome"
+PARTITION_MONTHS_AHEAD: int = 3
+ARCHIVE_DIR: str = os.environ.get("ARCHIVE_DIR", "data/archive")
+
+# Parent tables come before the tables referencing them: partitions are created and attached in this order and
+# detached in the reverse one.
+PARTITIONED_TABLES: List[str] = [
+    models.Group.__tablename__,
+    models.UserGroup.__tablename__,
+]
+
+logger = next(logging.getLogger(name) for name in logging.root.manager.loggerDict)
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def partition_bounds(month: date) -> str:
+    return f"FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+
+
+def season_months(season: int) -> List[date]:
+    return [date(season, month, 1) for month in range(1, 13)]
+
+
+def is_partitioned(db_engine: sqlalchemy.engine.Engine) -> bool:
+    return db_engine.dialect.name == "postgresql"
+
+
+def existing_partitions(connection: sqlalchemy.engine.Connection, table: str) -> List[str]:
+    return list(connection.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        WHERE parent.relname = :table
+        ORDER BY child.relname
+    """), {"table": table}).scalars())
+
+
+def ensure_partitions(db_engine: sqlalchemy.engine.Engine = engine, start: Optional[date] = None,
+                      months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    if not is_partitioned(db_engine):
+        return []
+
+    month: date = month_start(start or pendulum.today(tz=DEFAULT_TIMEZONE).date())
+    created: List[str] = []
+    with db_engine.begin() as connection:
+        for _ in range(months_ahead + 1):
+            for table in PARTITIONED_TABLES:
+                name: str = partition_name(table, month)
+                if name not in existing_partitions(connection, table):
+                    connection.execute(text(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES "
+                                            f"{partition_bounds(month)}"))
+                    created.append(name)
+            month = next_month(month)
+
+    return created
+
+
+def archive_file(archive_dir: str, name: str) -> str:
+    return os.path.join(archive_dir, f"{name}.csv.gz")
+
+
+def archive_season(season: int, db_engine: sqlalchemy.engine.Engine = engine, archive_dir: str = ARCHIVE_DIR) \
+        -> List[str]:
+    if season >= pendulum.today(tz=DEFAULT_TIMEZONE).year:
+        raise ValueError(f"Season {season} is not over yet, it can not be archived")
+
+    os.makedirs(archive_dir, exist_ok=True)
+    archived: List[str] = []
+    for month in season_months(season):
+        for table in reversed(PARTITIONED_TABLES):
+            name: str = partition_name(table, month)
+            with db_engine.begin() as connection:
+                if name not in existing_partitions(connection, table):
+                    continue
+
+                path: str = archive_file(archive_dir, name)
+                with gzip.open(f"{path}.tmp", "wb") as f:
+                    connection.connection.cursor().copy_expert(f"COPY {name} TO STDOUT WITH CSV HEADER", f)
+                os.replace(f"{path}.tmp", path)
+
+                connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+                connection.execute(text(f"DROP TABLE {name}"))
+            archived.append(path)
+            logger.warning(f"partition {name} archived to {path}")
+
+    return archived
+
+
+def restore_season(season: int, db_engine: sqlalchemy.engine.Engine = engine, archive_dir: str = ARCHIVE_DIR) \
+        -> List[str]:
+    restored: List[str] = []
+    for month in season_months(season):
+        for table in PARTITIONED_TABLES:
+            name: str = partition_name(table, month)
+            path: str = archive_file(archive_dir, name)
+            if not os.path.exists(path):
+                continue
+
+            with db_engine.begin() as connection:
+                if name in existing_partitions(connection, table):
+                    continue
+
+                connection.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+                with gzip.open(path, "rb") as f:
+                    columns: str = f.readline().decode().strip()
+                    connection.connection.cursor().copy_expert(f"COPY {name} ({columns}) FROM STDIN WITH CSV", f)
+                connection.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES "
+                                        f"{partition_bounds(month)}"))
+            restored.append(name)
+            logger.warning(f"partition {name} restored from {path}")
+
+    return restored
+
+
+def partition_sizes(db_engine: sqlalchemy.engine.Engine = engine) -> List[Tuple[str, int, int]]:
+    with db_engine.connect() as connection:
+        return [
+            (name, *connection.execute(text("SELECT pg_table_size(:name), pg_indexes_size(:name)"),
+                                       {"name": name}).one())
+            for table in PARTITIONED_TABLES
+            for name in existing_partitions(connection, table)
+        ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Gestione delle partizioni mensili di groups e user_groups")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    ensure_parser = subparsers.add_parser("ensure", help="Crea le partizioni del mese corrente e dei successivi")
+    ensure_parser.add_argument("--months-ahead", type=int, default=PARTITION_MONTHS_AHEAD)
+    for command, description in [("archive", "Stacca e archivia una stagione"),
+                                 ("restore", "Ripristina una stagione archiviata")]:
+        command_parser = subparsers.add_parser(command, help=description)
+        command_parser.add_argument("season", type=int)
+        command_parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    subparsers.add_parser("sizes", help="Mostra dimensione dati e indici delle partizioni")
+    args = parser.parse_args()
+
+    if args.command == "ensure":
+        print(ensure_partitions(months_ahead=args.months_ahead))
+    elif args.command == "archive":
+        print(archive_season(args.season, archive_dir=args.archive_dir))
+    elif args.command == "restore":
+        print(restore_season(args.season, archive_dir=args.archive_dir))
+    else:
+        for name, table_size, indexes_size in partition_sizes():
+            print(f"{name}\t{table_size}\t{indexes_size}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+
+TRANSPONDER_MAX_LENGTH: int = 20
 
 
 ## User part
@@ -13,6 +15,8 @@ class UserBase(BaseModel):
     luogo_nascita: Optional[str] = ""
     luogo_residenza: Optional[str] = ""
     via_residenza: Optional[str] = ""
+    codice_luogo_nascita: Optional[str] = None
+    codice_luogo_residenza: Optional[str] = None
     telefono: Optional[str] = ""
     tipo_utente: Optional[str] = ""
     attivita: Optional[str] = ""
@@ -65,6 +69,11 @@ class Group(GroupCreate):
         orm_mode = True
 
 
+class GroupAssignment(BaseModel):
+    nome: str
+    user_ids: List[int]
+
+
 ## UserGroup part
 class UserGroupBase(BaseModel):
     group_id: int
@@ -77,5 +86,48 @@ class UserGroupCreate(UserGroupBase):
 
 
 class UserGroup(UserGroupCreate):
+    transponder: Optional[str] = None
+
     class Config:
         orm_mode = True
+
+
+## Scheduler part
+class TrackRules(BaseModel):
+    capienza: int = 10
+    durata_sessione_minuti: int = 10
+    cambio_minuti: int = 5
+    separa_minorenni: bool = True
+    inizio: Optional[datetime] = None
+
+
+class PlannedSession(BaseModel):
+    nome: str
+    attivita: str
+    minorenni: Optional[bool]
+    inizio: datetime
+    fine: datetime
+    user_ids: List[int]
+
+
+## Timing part
+class Passing(BaseModel):
+    transponder: str = Field(min_length=1, max_length=TRANSPONDER_MAX_LENGTH)
+    timestamp: datetime
+
+
+class LeaderboardEntry(BaseModel):
+    transponder: str
+    user_id: Optional[int]
+    giri: int
+    miglior_giro: Optional[float]
+    ultimo_giro: Optional[float]
+    media_giri_recenti: Optional[float]
+
+
+## Places part
+class Place(BaseModel):
+    codice: str
+    nome: str
+    provincia: str
+    attivo: bool
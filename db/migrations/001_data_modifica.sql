@@ -0,0 +1,3 @@
+-- Last-modified timestamp used to build ETag validators for users and groups.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS data_modifica TIMESTAMP NOT NULL DEFAULT now();
+ALTER TABLE groups ADD COLUMN IF NOT EXISTS data_modifica TIMESTAMP NOT NULL DEFAULT now();
@@ -0,0 +1,60 @@
+-- Converts groups and user_groups to tables partitioned by month.
+-- New monthly partitions are then created by the api at startup (database/partitions.py).
+BEGIN;
+
+ALTER TABLE user_groups RENAME TO user_groups_old;
+ALTER TABLE groups RENAME TO groups_old;
+ALTER SEQUENCE groups_id_seq RENAME TO groups_old_id_seq;
+
+CREATE TABLE groups (
+    id SERIAL,
+    id_ticket INTEGER,
+    nome VARCHAR(50),
+    data_assegnazione TIMESTAMP NOT NULL,
+    data_modifica TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (id, data_assegnazione)
+) PARTITION BY RANGE (data_assegnazione);
+
+CREATE TABLE user_groups (
+    group_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL REFERENCES users (id) ON UPDATE CASCADE ON DELETE CASCADE,
+    assignment_date TIMESTAMP NOT NULL,
+    PRIMARY KEY (group_id, user_id, assignment_date),
+    FOREIGN KEY (group_id, assignment_date) REFERENCES groups (id, data_assegnazione)
+        ON UPDATE CASCADE ON DELETE CASCADE
+) PARTITION BY RANGE (assignment_date);
+
+DO $$
+DECLARE
+    month DATE := date_trunc('month', COALESCE((SELECT min(data_assegnazione) FROM groups_old), now()));
+    last_month DATE := date_trunc('month', now() + INTERVAL '3 months');
+BEGIN
+    WHILE month <= last_month LOOP
+        EXECUTE format('CREATE TABLE groups_%s PARTITION OF groups FOR VALUES FROM (%L) TO (%L)',
+                       to_char(month, 'YYYY_MM'), month, month + INTERVAL '1 month');
+        EXECUTE format('CREATE TABLE user_groups_%s PARTITION OF user_groups FOR VALUES FROM (%L) TO (%L)',
+                       to_char(month, 'YYYY_MM'), month, month + INTERVAL '1 month');
+        month := month + INTERVAL '1 month';
+    END LOOP;
+END $$;
+
+INSERT INTO groups (id, id_ticket, nome, data_assegnazione, data_modifica)
+SELECT id, id_ticket, nome, data_assegnazione, data_modifica FROM groups_old;
+
+INSERT INTO user_groups (group_id, user_id, assignment_date)
+SELECT user_groups_old.group_id, user_groups_old.user_id, groups_old.data_assegnazione
+FROM user_groups_old
+JOIN groups_old ON groups_old.id = user_groups_old.group_id;
+
+SELECT setval('groups_id_seq', COALESCE((SELECT max(id) FROM groups), 0) + 1, false);
+
+DROP TABLE user_groups_old;
+DROP TABLE groups_old;
+
+CREATE INDEX idx_id ON groups (id);
+CREATE INDEX ix_groups_id ON groups (id);
+CREATE INDEX ix_groups_id_ticket ON groups (id_ticket);
+CREATE INDEX ix_groups_data_assegnazione ON groups (data_assegnazione);
+CREATE INDEX idx_ticket_data ON groups (id_ticket, data_assegnazione);
+
+COMMIT;
@@ -0,0 +1,2 @@
+-- Transponder assigned to each member of a group.
+ALTER TABLE user_groups ADD COLUMN IF NOT EXISTS transponder VARCHAR(20);
@@ -0,0 +1,4 @@
+-- Normalized place codes (cadastral/Belfiore codes) for birth and residence places.
+ALTER TABLE users ADD COLUMN IF NOT EXISTS codice_luogo_nascita VARCHAR(4);
+ALTER TABLE users ADD COLUMN IF NOT EXISTS codice_luogo_residenza VARCHAR(4);
+CREATE INDEX IF NOT EXISTS ix_users_codice_luogo_residenza ON users (codice_luogo_residenza);
@@ -0,0 +1,9 @@
+-- Change tracking for the incremental analytics export (database/incremental_export.py).
+-- The tombstones table is created by the api at startup.
+ALTER TABLE children ADD COLUMN IF NOT EXISTS data_modifica TIMESTAMP NOT NULL DEFAULT now();
+ALTER TABLE user_groups ADD COLUMN IF NOT EXISTS data_modifica TIMESTAMP NOT NULL DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS idx_users_modifica ON users (data_modifica, id);
+CREATE INDEX IF NOT EXISTS idx_children_modifica ON children (data_modifica, id);
+CREATE INDEX IF NOT EXISTS idx_groups_modifica ON groups (data_modifica, id, data_assegnazione);
+CREATE INDEX IF NOT EXISTS idx_user_groups_modifica ON user_groups (data_modifica, group_id, user_id, assignment_date);
@@ -1,15 +1,23 @@
+import io
 import json
 import logging
+import os
+import threading
 import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 from enum import StrEnum
 from hashlib import sha256
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import pendulum
 import qrcode
 import requests
 import streamlit as st
 from codicefiscale import codicefiscale
+from PIL import Image
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 from database import schemas
 
@@ -21,7 +29,20 @@ HEADERS = {
 }
 
 API_BASE_URL: str = "http://api:8000"
+VALIDATORS_CACHE_SIZE: int = 1024
+WRITE_TIMEOUT_SECONDS: float = 5.0
+WRITE_RETRIES: int = 3
+RETRY_STATUS_CODES: List[int] = [409, 429, 503]
 DEFAULT_TIMEZONE: str = "Europe/Rome"
+LOGO_PATH: str = "frontend_app/data/img/kcp_logo_small.png"
+LOGO_WIDTH: int = 250
+FAVICON_WIDTH: int = 32
+MAX_CHILDREN: int = 20
+FISCAL_CODES_CACHE_SIZE: int = 512
+PLACES_CACHE_SIZE: int = 2048
+PLACES_TIMEOUT_SECONDS: float = 1.0
+PROFILE_RERUNS: bool = os.environ.get("PROFILE_RERUNS", "0") == "1"
+PROXY_TOKEN: str = os.environ.get("ADMISSION_PROXY_TOKEN", "")
 
 activity_cols: Dict[str, str] = {
     "kart": "Kart non agonistico",
@@ -40,9 +61,11 @@ class FormName(StrEnum):
     COGNOME = "cognome"
     DATA_NASCITA = "data_nascita"
     LUOGO_NASCITA = "luogo_nascita"
+    CODICE_LUOGO_NASCITA = "codice_luogo_nascita"
     PROVINCIA_NASCITA = "provincia_nascita"
     CODICE_FISCALE = "codice_fiscale"
     LUOGO_RESIDENZA = "luogo_residenza"
+    CODICE_LUOGO_RESIDENZA = "codice_luogo_residenza"
     VIA_RESIDENZA = "via_residenza"
     PROVINCIA_RESIDENZA = "provincia_residenza"
     TELEFONO = "telefono"
@@ -53,26 +76,87 @@ class FormName(StrEnum):
     ATTIVITA = "attivita"
 
 
+class RerunProfiler:
+    def __init__(self) -> None:
+        self.start: float = time.perf_counter()
+        self.sections: Dict[str, float] = {}
+
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.sections[name] = self.sections.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    def log(self) -> None:
+        total: float = (time.perf_counter() - self.start) * 1000
+        sections: str = ", ".join(f"{name}={elapsed:.1f}ms" for name, elapsed in self.sections.items())
+        logger.warning(f"rerun {total:.1f}ms: {sections}")
+
+
+@st.cache_resource(show_spinner=False)
+def load_logo(width: int) -> bytes:
+    logo = Image.open(LOGO_PATH)
+    logo.thumbnail((width, width))
+    buffer = io.BytesIO()
+    logo.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+@st.cache_data(max_entries=FISCAL_CODES_CACHE_SIZE, show_spinner=False)
+def decode_fiscal_code(cod_fiscale: str) -> Optional[Dict[str, Any]]:
+    if not codicefiscale.is_valid(cod_fiscale):
+        return None
+    return codicefiscale.decode(cod_fiscale)
+
+
+@st.cache_data(max_entries=FISCAL_CODES_CACHE_SIZE, show_spinner=False)
+def fiscal_code_prefixes(cognome: str, nome: str, data_nascita: str, luogo_nascita: str) -> List[str]:
+    return [
+        codicefiscale.encode(
+            lastname=cognome,
+            firstname=nome,
+            gender=gender,
+            birthdate=data_nascita,
+            birthplace=luogo_nascita,
+        )[:-5].upper()
+        for gender in ["M", "F"]
+    ]
+
+
+@st.cache_data(show_spinner=False)
+def child_birth_date_bounds(today: pendulum.Date) -> Tuple[pendulum.Date, pendulum.Date]:
+    return today.subtract(years=18).add(days=1), today.subtract(years=6)
+
+
 def decodifica_codice_fiscale(cod_fiscale: str) -> Dict[str, Any]:
     if not cod_fiscale:
         return {}
 
-    if not codicefiscale.is_valid(cod_fiscale):
+    decoded_cod_fiscale: Optional[Dict[str, Any]] = decode_fiscal_code(cod_fiscale)
+    if decoded_cod_fiscale is None:
         st.error("Il Codice fiscale inserito non e' un codice fiscale italiano valido")
         return {}
 
-    decoded_cod_fiscale: Dict[str, Any] = codicefiscale.decode(cod_fiscale)
     return {
         FormName.DATA_NASCITA: decoded_cod_fiscale.get("birthdate", pendulum.datetime(1970, 1, 1, tz=DEFAULT_TIMEZONE)),
         FormName.LUOGO_NASCITA: decoded_cod_fiscale.get("birthplace", {}).get("name", ""),
+        FormName.CODICE_LUOGO_NASCITA: decoded_cod_fiscale.get("birthplace", {}).get("code", ""),
         FormName.PROVINCIA_NASCITA: decoded_cod_fiscale.get("birthplace", {}).get("province", ""),
     }
 
 
-def regolamento_associativo_popup() -> bool:
-    regolamento_associativo = f"""Il/La sottoscritto/a
-- dichara di aver letto e compreso in ogni dettaglio il regolamento associativo {pendulum.now(DEFAULT_TIMEZONE).year} per le predette attività, predisposto dalla stessa asd motorart
-- di aver compreso che i soci ordinari rispondono in prima persona delle azioni compiute all'interno degli spazi associativi ed in particolare nell'utilizzo dei kart/moto/mini-moto e che gli istruttori sportivi rispondono nei limiti di quanto previsto dal regolamento associativo {pendulum.now(DEFAULT_TIMEZONE).year} ovvero per quanto direttamente connesso alle direttive impartite secondo la corretta disciplina sportiva.
+@st.cache_data(ttl=3600, show_spinner=False)
+def current_year() -> int:
+    return pendulum.now(DEFAULT_TIMEZONE).year
+
+
+@st.cache_data(show_spinner=False)
+def dichiarazione_responsabilita(anno: int) -> str:
+    return f"""Il/La sottoscritto/a
+- dichara di aver letto e compreso in ogni dettaglio il regolamento associativo {anno} per le predette attività, predisposto dalla stessa asd motorart
+- di aver compreso che i soci ordinari rispondono in prima persona delle azioni compiute all'interno degli spazi associativi ed in particolare nell'utilizzo dei kart/moto/mini-moto e che gli istruttori sportivi rispondono nei limiti di quanto previsto dal regolamento associativo {anno} ovvero per quanto direttamente connesso alle direttive impartite secondo la corretta disciplina sportiva.
 - chiede di utilizzare la copertura assicurativa base (così indicata nella polizza assicurativa dell'asd visionata insieme al regolamento associativo) versando per la quota associativa la somma di €__
 - chiede di utilizzare la copertura assicurativa integrativa (che prevede l'abbattimento delle franchigie e l'innalzamento dei rimborsi così come indicato nella polizza assicurativa dell'asd visionata insieme al regolamento associativo) versando la somma integrativa di € __
 - il sottoscritto allega alla sottoscritta il certificato di idionetá alla pratica sportiva non agonistica
@@ -80,8 +164,10 @@ def regolamento_associativo_popup() -> bool:
 - chiede di essere informato via mail/sms/whatsapp e altri mezzi di comunicazione sulle attività dell'associazione
 """
 
+
+def regolamento_associativo_popup(anno: int) -> bool:
     with st.expander("Dichiarazione di responsabilita'", expanded=False):
-        st.markdown(regolamento_associativo)
+        st.markdown(dichiarazione_responsabilita(anno))
         return st.checkbox(label="Ho letto ed accetto il Regolamento associativo")
 
 
@@ -122,6 +208,56 @@ A) PISTA GO-KART
         st.write(regolamento_associativo)
 
 
+class ValidatorsCache:
+    def __init__(self, max_entries: int = VALIDATORS_CACHE_SIZE) -> None:
+        self.max_entries: int = max_entries
+        self._entries: OrderedDict[str, Tuple[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url: str) -> Optional[Tuple[str, Any]]:
+        with self._lock:
+            if url in self._entries:
+                self._entries.move_to_end(url)
+            return self._entries.get(url)
+
+    def put(self, url: str, etag: str, data: Any) -> None:
+        with self._lock:
+            self._entries[url] = (etag, data)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+@st.cache_resource
+def get_validators_cache() -> ValidatorsCache:
+    return ValidatorsCache()
+
+
+def client_headers() -> Dict[str, str]:
+    headers: Dict[str, str] = {**HEADERS, "X-Proxy-Token": PROXY_TOKEN} if PROXY_TOKEN else dict(HEADERS)
+    if ctx := get_script_run_ctx():
+        headers["X-Client-Id"] = ctx.session_id
+    return headers
+
+
+def get_with_validators(url: str) -> Tuple[int, Any]:
+    cache: ValidatorsCache = get_validators_cache()
+    headers: Dict[str, str] = client_headers()
+    if cached := cache.get(url):
+        headers["If-None-Match"] = cached[0]
+
+    response = requests.get(url, headers=headers)
+    if response.status_code == 304 and cached:
+        return 200, cached[1]
+    if response.status_code != 200:
+        return response.status_code, None
+
+    data: Any = response.json()
+    if etag := response.headers.get("ETag"):
+        cache.put(url, etag, data)
+    return response.status_code, data
+
+
 def generate_and_show_qr_code(user: Dict[str, Any]) -> None:
     digest: str = sha256(json.dumps(user, sort_keys=True).encode("utf8")).hexdigest()
     img = qrcode.make(digest)
@@ -142,59 +278,45 @@ def validate_data(user_data: Dict[str, Any]) -> bool:
     if not validated:
         return validated
 
-    for gender in ["M", "F"]:
-        test_fiscal_code: str = codicefiscale.encode(
-            lastname=user_data.get(FormName.COGNOME),
-            firstname=user_data.get(FormName.NOME),
-            gender=gender,
-            birthdate=user_data.get(FormName.DATA_NASCITA),
-            birthplace=user_data.get(FormName.LUOGO_NASCITA),
-        )[:-5].upper()
-
-        if test_fiscal_code == user_data.get(FormName.CODICE_FISCALE)[:-5]:
-            return True
-
-    return False
+    return user_data.get(FormName.CODICE_FISCALE)[:-5] in fiscal_code_prefixes(
+        user_data.get(FormName.COGNOME),
+        user_data.get(FormName.NOME),
+        user_data.get(FormName.DATA_NASCITA),
+        user_data.get(FormName.LUOGO_NASCITA),
+    )
 
 
 def validate_child(child: Dict[str, str], child_min_date: pendulum.Date) -> bool:
-    st.error(f"child min date {child_min_date} {type(child_min_date)}")
-    default_date: str = pendulum.today().date().strftime("%Y-%m-%d")
-    st.error(f"child date {child.get(FormName.DATA_NASCITA, default_date)}")
-    data_nascita: pendulum.date = pendulum.from_format(child.get(FormName.DATA_NASCITA, default_date), "YYYY-MM-DD",
-                                                       tz="Europe/Rome").date()
-    st.error(f"computed date {data_nascita} {type(data_nascita)}")
+    data_nascita: Optional[str] = child.get(FormName.DATA_NASCITA)
+    if not data_nascita:
+        return False
 
     return bool(
         child.get(FormName.NOME, "")
         and child.get(FormName.COGNOME, "")
-        and data_nascita > child_min_date
-        and codicefiscale.is_valid(child.get(FormName.CODICE_FISCALE, "")),
+        and pendulum.Date.fromisoformat(data_nascita) >= child_min_date
+        and decode_fiscal_code(child.get(FormName.CODICE_FISCALE, "")) is not None,
     )
 
 
-def validate_children(children: List[Dict[str, str]]) -> bool:
-    child_min_date: pendulum.Date = pendulum.today(DEFAULT_TIMEZONE).subtract(years=18).add(days=1).date()
+def validate_children(children: List[Dict[str, str]], today: pendulum.Date) -> bool:
+    child_min_date, _ = child_birth_date_bounds(today)
 
     return all(validate_child(child, child_min_date) for child in children)
 
 
-def add_child() -> List[Dict[str, str]]:
+def add_child(today: pendulum.Date) -> List[Dict[str, str]]:
     if "children" not in st.session_state:
-        print("children not in session state")
         st.session_state["children"] = []
 
-    today: pendulum.datetime = pendulum.today(DEFAULT_TIMEZONE)
-
-    child_min_date: pendulum.date = today.subtract(years=18).add(days=1).date()
-    child_max_date: pendulum.date = today.subtract(years=6).date()
+    child_min_date, child_max_date = child_birth_date_bounds(today)
 
     st.subheader("Sezione Genitori", divider="red")
     accept_child: bool = st.checkbox(
         label="Dichiaro di esercitare la potestà genitoriale sul/i minorenne/i registrato in quanto padre o madre dello stesso"
               " (Consapevole delle conseguenze civili e penali delle dichiarazioni mendaci)")
 
-    num_child: int = st.selectbox(label="Quanti figli devono guidare il kart?", options=list(range(20)), index=0)
+    num_child: int = st.selectbox(label="Quanti figli devono guidare il kart?", options=list(range(MAX_CHILDREN)), index=0)
 
     children: List[Dict[str, str]] = []
     for i in range(num_child):
@@ -229,14 +351,14 @@ def add_child() -> List[Dict[str, str]]:
             label="Tipologia ammissione figlio/a",
             options=["tesserato", "socio"],
             index=0,
-            key="child_type",
+            key=f"tipo_figlio_{i}",
             format_func=tipo_utente_cols.get,
         )
 
         child_activity: str = st.radio(
             label="Tipologia attivita' figlio/a",
             options=["kart", "moto", "altro"],
-            key="child_activity",
+            key=f"attivita_figlio_{i}",
             format_func=activity_cols.get,
             index=0,
         )
@@ -282,7 +404,38 @@ def update_user_data(json_data: Dict[str, str]) -> None:
             st.session_state[field] = value
 
 
-def handle_user_fiscal_code(default_values: Dict[str, str], today: pendulum.date) -> Tuple[str, str, str]:
+@st.cache_data(ttl=24 * 60 * 60, max_entries=PLACES_CACHE_SIZE, show_spinner=False)
+def search_places(query: str) -> List[Dict[str, Any]]:
+    response = requests.get(f"{API_BASE_URL}/places/", params={"q": query}, headers=client_headers(),
+                            timeout=PLACES_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    return response.json()
+
+
+def place_input(label: str, value: str, selection_label: str, disabled: bool = False) -> Tuple[str, str]:
+    place_name: str = st.text_input(label=label, value=value, disabled=disabled)
+    if not place_name.strip() or disabled:
+        return place_name, ""
+
+    try:
+        places: List[Dict[str, Any]] = search_places(" ".join(place_name.lower().split()))
+    except Exception as e:
+        logger.warning(f"place search failed for {place_name}: {e}")
+        return place_name, ""
+
+    if not places:
+        st.caption("Comune non trovato, controlla quanto inserito")
+        return place_name, ""
+
+    selected: int = st.selectbox(
+        label=selection_label,
+        options=range(len(places)),
+        format_func=lambda index: f"{places[index]['nome']} ({places[index]['provincia']})",
+    )
+    return places[selected]["nome"], places[selected]["codice"]
+
+
+def handle_user_fiscal_code(default_values: Dict[str, str], today: pendulum.Date) -> Tuple[str, str, str, str]:
     fiscal_code = st.text_input(
         label="Codice Fiscale :red[*]",
         max_chars=16,
@@ -295,6 +448,7 @@ def handle_user_fiscal_code(default_values: Dict[str, str], today: pendulum.date
             value=decoded_cod_fiscale.get(FormName.LUOGO_NASCITA, ""),
             disabled=st.session_state.renew,
         )
+        birth_place_code: str = decoded_cod_fiscale.get(FormName.CODICE_LUOGO_NASCITA, "")
         birth_date = st.date_input(
             label="Data di Nascita :red[*]",
             value=decoded_cod_fiscale.get(FormName.DATA_NASCITA,
@@ -304,10 +458,11 @@ def handle_user_fiscal_code(default_values: Dict[str, str], today: pendulum.date
             disabled=st.session_state.renew,
         )
     else:
-        birth_place = st.text_input(
+        birth_place, birth_place_code = place_input(
             label="Luogo di Nascita :red[*]",
-            disabled=st.session_state.renew,
             value=default_values[FormName.LUOGO_NASCITA],
+            selection_label="Seleziona il comune di nascita",
+            disabled=st.session_state.renew,
         )
         birth_date = st.date_input(
             label="Data di Nascita :red[*]",
@@ -316,10 +471,10 @@ def handle_user_fiscal_code(default_values: Dict[str, str], today: pendulum.date
             max_value=today.replace(year=today.year - 18),
             disabled=st.session_state.renew,
         )
-    return fiscal_code, birth_date, birth_place
+    return fiscal_code, birth_date, birth_place, birth_place_code
 
 
-def registration_form(user_to_renew: schemas.User = None):
+def registration_form(profiler: RerunProfiler, user_to_renew: schemas.User = None):
     if "renew" not in st.session_state or not st.session_state.renew:
         st.session_state["renew"] = bool(user_to_renew)
 
@@ -348,11 +503,11 @@ def registration_form(user_to_renew: schemas.User = None):
         }
 
     # with st.form('registration_form'):
-    pendulum.today().date()
+    today: pendulum.Date = pendulum.today(DEFAULT_TIMEZONE).date()
     with st.container():
         show_regolamento_associativo()
 
-        fiscal_code, birth_date, birth_place = handle_user_fiscal_code()
+        fiscal_code, birth_date, birth_place, birth_place_code = handle_user_fiscal_code(default_values, today)
 
         name = st.text_input(
             label="Nome :red[*]",
@@ -364,10 +519,10 @@ def registration_form(user_to_renew: schemas.User = None):
             disabled=st.session_state.renew,
             value=default_values[FormName.COGNOME],
         )
-        residence_place = st.text_input(
+        residence_place, residence_place_code = place_input(
             label="Luogo di Residenza :red[*]",
-            disabled=False,
             value=default_values[FormName.LUOGO_RESIDENZA],
+            selection_label="Seleziona il comune di residenza",
         )
         residence_street = st.text_input(
             label="Via di Residenza :red[*]",
@@ -393,10 +548,12 @@ def registration_form(user_to_renew: schemas.User = None):
             index=0,
         )
 
-        regolamento_associativo: bool = regolamento_associativo_popup()
-        privacy_policy: bool = privacy_policy_popup()
+        with profiler.section("testi_legali"):
+            regolamento_associativo: bool = regolamento_associativo_popup(current_year())
+            privacy_policy: bool = privacy_policy_popup()
 
-        children: List[Dict[str, str]] = add_child()
+        with profiler.section("figli"):
+            children: List[Dict[str, str]] = add_child(today)
 
         user_data = {
             str(FormName.CODICE_FISCALE): fiscal_code.upper(),
@@ -405,6 +562,8 @@ def registration_form(user_to_renew: schemas.User = None):
             str(FormName.DATA_NASCITA): str(birth_date),
             str(FormName.LUOGO_NASCITA): " ".join([x.capitalize() for x in birth_place.split()]),
             str(FormName.LUOGO_RESIDENZA): " ".join([x.capitalize() for x in residence_place.split()]),
+            str(FormName.CODICE_LUOGO_NASCITA): birth_place_code,
+            str(FormName.CODICE_LUOGO_RESIDENZA): residence_place_code,
             str(FormName.VIA_RESIDENZA): " ".join([x.capitalize() for x in residence_street.split()]),
             str(FormName.TELEFONO): phone_number,
             str(FormName.TIPO_UTENTE): user_type,
@@ -412,8 +571,9 @@ def registration_form(user_to_renew: schemas.User = None):
         }
         update_user_data(user_data)
 
-        data_validated: bool = validate_data(user_data) and validate_children(children) and regolamento_associativo \
-                               and privacy_policy
+        with profiler.section("validazione"):
+            data_validated: bool = validate_data(user_data) and validate_children(children, today) \
+                                   and regolamento_associativo and privacy_policy
 
         register_button = st.columns(5)[2].button(
             label="Firma",
@@ -425,10 +585,11 @@ def registration_form(user_to_renew: schemas.User = None):
         if not register_button or not privacy_policy or not regolamento_associativo:
             return
 
+        submission_id: str = str(uuid.uuid4())
         if st.session_state.renew:
-            parent_id: Optional[int] = renew_user(user_data)
+            parent_id: Optional[int] = renew_user(user_data, f"{submission_id}-user")
         else:
-            parent_id: Optional[int] = save_user_to_db(user_data)
+            parent_id: Optional[int] = save_user_to_db(user_data, f"{submission_id}-user")
         if not parent_id:
             return
 
@@ -438,10 +599,10 @@ def registration_form(user_to_renew: schemas.User = None):
             st.experimental_rerun()
             return
 
-        children_ids: List[int] = save_children_to_db(children, parent_id)
+        children_ids: List[int] = save_children_to_db(children, parent_id, f"{submission_id}-children")
         if not children_ids:
             st.write("error saving children")
-            if not remove_children_from_db(children_ids):
+            if not remove_children_from_db(children_ids, f"{submission_id}-remove-children"):
                 st.write("error removing children")
                 return
             return
@@ -451,25 +612,41 @@ def registration_form(user_to_renew: schemas.User = None):
         st.experimental_rerun()
 
 
-def remove_children_from_db(children_id: List[int]) -> bool:
-    response = requests.delete(f"{API_BASE_URL}/childrens/", json=children_id, headers=HEADERS)
+def send_write_request(method: str, url: str, json_data: Any, idempotency_key: str) -> requests.Response:
+    headers: Dict[str, str] = {**client_headers(), "Idempotency-Key": idempotency_key}
+
+    for attempt in range(WRITE_RETRIES):
+        try:
+            response = requests.request(method, url, json=json_data, headers=headers, timeout=WRITE_TIMEOUT_SECONDS)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == WRITE_RETRIES - 1:
+                raise
+            logger.warning(f"{method} {url} failed, retrying: {e}")
+            continue
+
+        if response.status_code not in RETRY_STATUS_CODES or attempt == WRITE_RETRIES - 1:
+            return response
+        time.sleep(float(response.headers.get("Retry-After", 1)))
+
+    return response
+
+
+def remove_children_from_db(children_id: List[int], idempotency_key: str) -> bool:
+    response = send_write_request("DELETE", f"{API_BASE_URL}/childrens/", children_id, idempotency_key)
 
     return response.status_code == 200
 
 
-def save_children_to_db(children: List[Dict[str, str]], parent_id: int) -> Optional[List[int]]:
-    response = requests.post(
-        url=f"{API_BASE_URL}/childrens/{parent_id}",
-        json=children,
-        headers=HEADERS,
-    )
+def save_children_to_db(children: List[Dict[str, str]], parent_id: int, idempotency_key: str) \
+        -> Optional[List[int]]:
+    response = send_write_request("POST", f"{API_BASE_URL}/childrens/{parent_id}", children, idempotency_key)
 
     return response.json() if response.status_code == 200 else None
 
 
-def save_user_to_db(user_data: Dict[str, str]) -> Optional[int]:
+def save_user_to_db(user_data: Dict[str, str], idempotency_key: str) -> Optional[int]:
     user_data = {str(k): str(v) for k, v in user_data.items()}
-    response = requests.post(f"{API_BASE_URL}/users", json=user_data, headers=HEADERS, params={})
+    response = send_write_request("POST", f"{API_BASE_URL}/users/", user_data, idempotency_key)
     if response.status_code == 200:
         st.success("Utente registrato correttamente!")
 
@@ -479,8 +656,8 @@ def save_user_to_db(user_data: Dict[str, str]) -> Optional[int]:
     return None
 
 
-def renew_user(user_data: Dict[str, str]) -> Optional[int]:
-    response = requests.put(f"{API_BASE_URL}/users/", json=user_data)
+def renew_user(user_data: Dict[str, str], idempotency_key: str) -> Optional[int]:
+    response = send_write_request("PUT", f"{API_BASE_URL}/users/", user_data, idempotency_key)
     if response.status_code == 200:
         st.success("Utente aggiornato correttamente!")
         return response.json()
@@ -515,9 +692,9 @@ def already_registered_form() -> Optional[schemas.User]:
             return None
 
         try:
-            response = requests.get(f"{API_BASE_URL}/users/{fiscal_code.upper()}", headers=HEADERS)
-            if response.status_code == 200:
-                return handle_registered_user(response.json())
+            status_code, data = get_with_validators(f"{API_BASE_URL}/users/{fiscal_code.upper()}")
+            if status_code == 200:
+                return handle_registered_user(data)
             else:
                 st.error("Errore durante la ricerca, riprova.")
         except Exception as e:
@@ -562,10 +739,10 @@ def social_media_icons():
     """, unsafe_allow_html=True)
 
 
-def main():
+def header() -> None:
     st.set_page_config(
         page_title="KCP Registrazione",
-        page_icon="data/img/kcp_logo_small.png",
+        page_icon=load_logo(FAVICON_WIDTH),
         layout="centered",
         initial_sidebar_state="expanded",
         menu_items={
@@ -576,9 +753,9 @@ def main():
     )
     with st.columns(3)[1]:
         st.image(
-            image="frontend_app/data/img/kcp_logo_small.png",
+            image=load_logo(LOGO_WIDTH),
             use_column_width="auto",
-            width=250,
+            width=LOGO_WIDTH,
         )
     st.title("KCP - Registrazione utente")
 
@@ -589,16 +766,29 @@ Per poter continuare devi compilare il modulo di registrazione.
 - Se non sei mai stato qui', devi compilare il {prettify_link('#form-di-registrazione', 'form in basso')}. Se sei un genitore, inserisci i tuoi dati nel form, mentre nella parte {prettify_link('#sezione-genitori', 'Sezione genitori')}, inserisci i dati dei figli che devono fare il giro sui kart
     """, unsafe_allow_html=True)
 
-    user_to_renew = already_registered_form()
-    if user_to_renew:
-        st.session_state.renew = True
-        update_user_data(user_to_renew.model_dump())
-
-    st.subheader("Form di registrazione", divider="red")
-    registration_form(user_to_renew=user_to_renew)
 
-    st.markdown("---")
-    social_media_icons()
+def main():
+    profiler = RerunProfiler()
+    try:
+        with profiler.section("intestazione"):
+            header()
+
+        with profiler.section("controllo_utente"):
+            user_to_renew = already_registered_form()
+            if user_to_renew:
+                st.session_state.renew = True
+                update_user_data(user_to_renew.model_dump())
+
+        with profiler.section("registrazione"):
+            st.subheader("Form di registrazione", divider="red")
+            registration_form(profiler, user_to_renew=user_to_renew)
+
+        with profiler.section("footer"):
+            st.markdown("---")
+            social_media_icons()
+    finally:
+        if PROFILE_RERUNS:
+            profiler.log()
 
 
 if __name__ == "__main__":
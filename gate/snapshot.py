@@ -0,0 +1,92 @@
+import hashlib
+import struct
+from datetime import date, timedelta
+from typing import Iterable, NamedTuple, Tuple
+
+import numpy as np
+
+MAGIC: bytes = b"KCPG"
+FORMAT_VERSION: int = 1
+FULL_SNAPSHOT: int = 0
+DELTA_SNAPSHOT: int = 1
+HEADER = struct.Struct("<4sHHqqI4x16s")
+SALT_SIZE: int = 16
+HASH_DTYPE: np.dtype = np.dtype("<u8")
+EXPIRY_DTYPE: np.dtype = np.dtype("<u2")
+EPOCH: date = date(1970, 1, 1)
+VALIDITY_DAYS: int = 365
+ADULT_AGE: int = 18
+
+
+class SnapshotHeader(NamedTuple):
+    kind: int
+    version: int
+    base_version: int
+    count: int
+    salt: bytes
+
+
+def fiscal_code_hash(codice_fiscale: str, salt: bytes) -> int:
+    digest: bytes = hashlib.blake2b(codice_fiscale.strip().upper().encode(), digest_size=8, key=salt).digest()
+    return int.from_bytes(digest, "little")
+
+
+def adult_date(data_nascita: date) -> date:
+    try:
+        return data_nascita.replace(year=data_nascita.year + ADULT_AGE)
+    except ValueError:
+        return date(data_nascita.year + ADULT_AGE, 3, 1)
+
+
+def expiry_date(data_registrazione: date, data_nascita: date) -> date:
+    expiry: date = data_registrazione + timedelta(days=VALIDITY_DAYS)
+    if data_registrazione < adult_date(data_nascita):
+        expiry = min(expiry, adult_date(data_nascita) - timedelta(days=1))
+    return expiry
+
+
+def to_days(day: date) -> int:
+    return min(max((day - EPOCH).days, 0), np.iinfo(EXPIRY_DTYPE).max)
+
+
+def from_days(days: int) -> date:
+    return EPOCH + timedelta(days=int(days))
+
+
+def read_header(data: bytes) -> SnapshotHeader:
+    if len(data) < HEADER.size:
+        raise ValueError("Snapshot too short")
+    magic, format_version, kind, version, base_version, count, salt = HEADER.unpack_from(data)
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format {magic!r} v{format_version}")
+    return SnapshotHeader(kind, version, base_version, count, salt)
+
+
+def encode(header: SnapshotHeader, hashes: np.ndarray, expiries: np.ndarray) -> bytes:
+    order: np.ndarray = np.lexsort((expiries, hashes))
+    hashes, expiries = hashes[order], expiries[order]
+    last_of_hash: np.ndarray = np.append(hashes[1:] != hashes[:-1], True) if len(hashes) else hashes.astype(bool)
+    hashes, expiries = hashes[last_of_hash], expiries[last_of_hash]
+
+    return HEADER.pack(MAGIC, FORMAT_VERSION, header.kind, header.version, header.base_version, len(hashes),
+                       header.salt) + hashes.astype(HASH_DTYPE).tobytes() + expiries.astype(EXPIRY_DTYPE).tobytes()
+
+
+def decode(data: bytes) -> Tuple[SnapshotHeader, np.ndarray, np.ndarray]:
+    header: SnapshotHeader = read_header(data)
+    hashes: np.ndarray = np.frombuffer(data, dtype=HASH_DTYPE, count=header.count, offset=HEADER.size)
+    expiries: np.ndarray = np.frombuffer(data, dtype=EXPIRY_DTYPE, count=header.count,
+                                         offset=HEADER.size + HASH_DTYPE.itemsize * header.count)
+    return header, hashes, expiries
+
+
+def build(kind: int, version: int, base_version: int, members: Iterable[Tuple[str, date, date]],
+          salt: bytes) -> bytes:
+    members = list(members)
+    hashes: np.ndarray = np.fromiter((fiscal_code_hash(codice_fiscale, salt) for codice_fiscale, _, _ in members),
+                                     dtype=HASH_DTYPE, count=len(members))
+    expiries: np.ndarray = np.fromiter(
+        (to_days(expiry_date(data_registrazione, data_nascita)) for _, data_registrazione, data_nascita in members),
+        dtype=EXPIRY_DTYPE, count=len(members),
+    )
+    return encode(SnapshotHeader(kind, version, base_version, len(members), salt), hashes, expiries)
@@ -0,0 +1,144 @@
+import argparse
+import logging
+import os
+import time
+from datetime import date
+from typing import Dict, Optional
+
+import numpy as np
+import requests
+
+from gate import snapshot
+
+API_BASE_URL: str = os.environ.get("API_URL", "http://api:8000")
+SNAPSHOT_PATH: str = os.environ.get("GATE_SNAPSHOT_PATH", "data/gate/membri.snapshot")
+SYNC_TIMEOUT_SECONDS: float = 10.0
+SYNC_INTERVAL_SECONDS: int = 60
+PRIORITY_TOKEN: str = os.environ.get("ADMISSION_PRIORITY_TOKEN", "")
+HEADERS: Dict[str, str] = {"X-Priority-Token": PRIORITY_TOKEN} if PRIORITY_TOKEN else {}
+
+logger = next(logging.getLogger(name) for name in logging.root.manager.loggerDict)
+
+
+class GateVerifier:
+    def __init__(self, path: str = SNAPSHOT_PATH) -> None:
+        self.path: str = path
+        self.reload()
+
+    def reload(self) -> None:
+        with open(self.path, "rb") as f:
+            self.header: snapshot.SnapshotHeader = snapshot.read_header(f.read(snapshot.HEADER.size))
+        if self.header.kind != snapshot.FULL_SNAPSHOT:
+            raise ValueError(f"{self.path} is not a full snapshot")
+
+        count: int = self.header.count
+        if not count:
+            self.hashes: np.ndarray = np.empty(0, dtype=snapshot.HASH_DTYPE)
+            self.expiries: np.ndarray = np.empty(0, dtype=snapshot.EXPIRY_DTYPE)
+            return
+        self.hashes = np.memmap(self.path, dtype=snapshot.HASH_DTYPE, mode="r", offset=snapshot.HEADER.size,
+                                shape=(count,))
+        self.expiries = np.memmap(self.path, dtype=snapshot.EXPIRY_DTYPE, mode="r",
+                                  offset=snapshot.HEADER.size + snapshot.HASH_DTYPE.itemsize * count, shape=(count,))
+
+    @property
+    def version(self) -> int:
+        return self.header.version
+
+    def __len__(self) -> int:
+        return self.header.count
+
+    def expiry(self, codice_fiscale: str) -> Optional[date]:
+        key = np.uint64(snapshot.fiscal_code_hash(codice_fiscale, self.header.salt))
+        index: int = int(np.searchsorted(self.hashes, key))
+        if index < len(self.hashes) and self.hashes[index] == key:
+            return snapshot.from_days(self.expiries[index])
+        return None
+
+    def is_valid(self, codice_fiscale: str, today: Optional[date] = None) -> bool:
+        expiry: Optional[date] = self.expiry(codice_fiscale)
+        return expiry is not None and expiry >= (today or date.today())
+
+    def apply_delta(self, data: bytes) -> None:
+        header, hashes, expiries = snapshot.decode(data)
+        if header.kind != snapshot.DELTA_SNAPSHOT or header.salt != self.header.salt:
+            raise ValueError("Delta does not match the current snapshot")
+        if header.base_version > self.version:
+            raise ValueError(f"Delta starts at {header.base_version}, snapshot is at {self.version}")
+
+        merged_hashes: np.ndarray = np.concatenate([hashes, self.hashes])
+        merged_expiries: np.ndarray = np.concatenate([expiries, self.expiries])
+        merged_hashes, first = np.unique(merged_hashes, return_index=True)
+        merged_header = snapshot.SnapshotHeader(snapshot.FULL_SNAPSHOT, header.version, 0, len(merged_hashes),
+                                                header.salt)
+        write_snapshot(self.path, snapshot.encode(merged_header, merged_hashes, merged_expiries[first]))
+        self.reload()
+
+
+def write_snapshot(path: str, data: bytes) -> None:
+    snapshot.read_header(data)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.tmp", "wb") as f:
+        f.write(data)
+    os.replace(f"{path}.tmp", path)
+
+
+def download_full(api_url: str, path: str) -> None:
+    response = requests.get(f"{api_url}/gate/snapshot", headers=HEADERS, timeout=SYNC_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    write_snapshot(path, response.content)
+
+
+def sync(api_url: str = API_BASE_URL, path: str = SNAPSHOT_PATH) -> GateVerifier:
+    if not os.path.exists(path):
+        download_full(api_url, path)
+        return GateVerifier(path)
+
+    verifier = GateVerifier(path)
+    response = requests.get(f"{api_url}/gate/snapshot/delta", params={"since": verifier.version}, headers=HEADERS,
+                            timeout=SYNC_TIMEOUT_SECONDS)
+    if response.status_code == 200:
+        verifier.apply_delta(response.content)
+    elif response.status_code != 304:
+        download_full(api_url, path)
+        verifier.reload()
+    return verifier
+
+
+def sync_periodically(api_url: str, path: str, interval: int = SYNC_INTERVAL_SECONDS) -> None:
+    while True:
+        try:
+            verifier: GateVerifier = sync(api_url, path)
+            logger.warning(f"snapshot {verifier.version} with {len(verifier)} members")
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f"sync failed, keeping the local snapshot: {e}")
+        time.sleep(interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verifica offline dei soci al cancello")
+    parser.add_argument("--api-url", default=API_BASE_URL)
+    parser.add_argument("--snapshot", default=SNAPSHOT_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    sync_parser = subparsers.add_parser("sync", help="Scarica lo snapshot completo o gli aggiornamenti")
+    sync_parser.add_argument("--loop", action="store_true")
+    check_parser = subparsers.add_parser("check", help="Controlla uno o piu' codici fiscali")
+    check_parser.add_argument("codici_fiscali", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "sync":
+        if args.loop:
+            sync_periodically(args.api_url, args.snapshot)
+        verifier: GateVerifier = sync(args.api_url, args.snapshot)
+        print(f"snapshot {verifier.version}: {len(verifier)} members")
+        return
+
+    verifier = GateVerifier(args.snapshot)
+    for codice_fiscale in args.codici_fiscali:
+        expiry: Optional[date] = verifier.expiry(codice_fiscale)
+        status: str = "valido" if verifier.is_valid(codice_fiscale) else "non valido"
+        print(f"{codice_fiscale.upper()}: {status} (scadenza {expiry or 'n/d'})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+
+ROOT_DIR: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+WORK_DIR: str = tempfile.mkdtemp(prefix="kcp-tests-")
+os.makedirs(os.path.join(WORK_DIR, "data"))
+with open(os.path.join(WORK_DIR, "data", "secrets.toml"), "w") as f:
+    f.write('[database]\nurl = "sqlite://"\n')
+os.chdir(WORK_DIR)
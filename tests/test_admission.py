@@ -0,0 +1,115 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from api import admission
+from api.admission import ConcurrencyLimiter, RateLimiter, TokenBucket
+
+
+def test_token_bucket_allows_the_burst_then_refills():
+    bucket = TokenBucket(now=0.0)
+    assert [bucket.take(0.0) for _ in range(admission.RATE_LIMIT_BURST)] == [0.0] * admission.RATE_LIMIT_BURST
+
+    wait: float = bucket.take(0.0)
+    assert wait == pytest.approx(1 / admission.RATE_LIMIT_PER_SECOND)
+    assert bucket.take(wait) == 0.0
+
+
+def test_rate_limiter_keeps_one_bucket_per_client(monkeypatch):
+    monkeypatch.setattr(admission, "MAX_TRACKED_CLIENTS", 2)
+    limiter = RateLimiter()
+    for _ in range(admission.RATE_LIMIT_BURST):
+        assert limiter.retry_after("telefono-1") == 0.0
+
+    assert limiter.retry_after("telefono-1") > 0
+    assert limiter.retry_after("telefono-2") == 0.0
+    assert limiter.rejected == 1
+
+    limiter.retry_after("telefono-3")
+    assert limiter.clients == 2
+    assert limiter.retry_after("telefono-1") == 0.0
+
+
+def scope(client: str = "10.0.0.1") -> dict:
+    return {"client": (client, 1234)}
+
+
+def test_client_id_is_trusted_only_from_the_proxy(monkeypatch):
+    monkeypatch.setattr(admission, "PROXY_TOKEN", "proxy")
+    assert admission.client_id(scope(), {b"x-client-id": b"sessione"}) == "10.0.0.1"
+    assert admission.client_id(scope(), {b"x-client-id": b"sessione", b"x-proxy-token": b"wrong"}) == "10.0.0.1"
+    assert admission.client_id(scope(), {b"x-client-id": b"sessione", b"x-proxy-token": b"proxy"}) == "sessione"
+
+
+def test_priority_requires_the_priority_token(monkeypatch):
+    monkeypatch.setattr(admission, "PRIORITY_TOKEN", "desk")
+    monkeypatch.setattr(admission, "PROXY_TOKEN", "proxy")
+    assert admission.is_priority({b"x-priority-token": b"desk"})
+    assert not admission.is_priority({b"x-proxy-token": b"proxy"})
+    assert not admission.is_priority({})
+
+    monkeypatch.setattr(admission, "PRIORITY_TOKEN", "")
+    assert not admission.is_priority({b"x-priority-token": b""})
+
+
+def test_priority_requests_use_the_reserved_slots_and_skip_the_queue():
+    async def scenario() -> None:
+        limiter = ConcurrencyLimiter(limit=1)
+        assert await limiter.acquire(priority=False)
+        assert [await limiter.acquire(priority=True) for _ in range(admission.PRIORITY_RESERVED_SLOTS)] == \
+               [True] * admission.PRIORITY_RESERVED_SLOTS
+
+        served: List[str] = []
+
+        async def request(name: str, priority: bool) -> None:
+            if await limiter.acquire(priority):
+                served.append(name)
+
+        tasks = [asyncio.create_task(request(name, name.startswith("desk")))
+                 for name in ["telefono-0", "desk-1", "telefono-2", "desk-3"]]
+        await asyncio.sleep(0)
+        assert limiter.metrics()["in_coda"] == 2 and limiter.metrics()["in_coda_prioritarie"] == 2
+
+        while len(served) < len(tasks):
+            limiter.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert served == ["desk-1", "desk-3", "telefono-0", "telefono-2"]
+
+    asyncio.run(scenario())
+
+
+def test_timed_out_waiters_do_not_fill_the_queue(monkeypatch):
+    monkeypatch.setattr(admission, "QUEUE_SIZE", 2)
+    monkeypatch.setattr(admission, "QUEUE_TIMEOUT_SECONDS", 0.01)
+
+    async def scenario() -> None:
+        limiter = ConcurrencyLimiter(limit=1)
+        assert await limiter.acquire(priority=False)
+        assert await asyncio.gather(limiter.acquire(False), limiter.acquire(False)) == [False, False]
+        assert limiter.metrics()["in_coda"] == 0
+
+        limiter.release()
+        assert await limiter.acquire(priority=False)
+        assert limiter.metrics()["scadute_in_coda"] == 2
+        assert limiter.metrics()["rifiutate_coda_piena"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_rejects_new_requests(monkeypatch):
+    monkeypatch.setattr(admission, "QUEUE_SIZE", 1)
+
+    async def scenario() -> None:
+        limiter = ConcurrencyLimiter(limit=1)
+        assert await limiter.acquire(priority=False)
+        waiter = asyncio.create_task(limiter.acquire(priority=False))
+        await asyncio.sleep(0)
+        assert not await limiter.acquire(priority=False)
+        assert limiter.rejected == 1
+
+        limiter.release()
+        assert await waiter
+
+    asyncio.run(scenario())
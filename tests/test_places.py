@@ -0,0 +1,31 @@
+import pytest
+
+from api.places import PlaceIndex, with_place_codes
+from database import schemas
+
+
+@pytest.fixture(scope="module")
+def index() -> PlaceIndex:
+    return PlaceIndex.load()
+
+
+def make_user(**places: str) -> schemas.UserBase:
+    return schemas.UserBase(codice_fiscale="RSSMRA80A01H501U", nome="Mario", cognome="Rossi",
+                            data_nascita="1980-01-01", **places)
+
+
+def test_birth_place_falls_back_to_an_inactive_comune(index):
+    user: schemas.UserBase = with_place_codes(index, make_user(luogo_nascita="San Giorgio"))
+    assert user.codice_luogo_nascita == "H879"
+
+
+def test_residence_never_resolves_to_an_inactive_comune(index):
+    user: schemas.UserBase = with_place_codes(index, make_user(luogo_residenza="san giorgio",
+                                                               codice_luogo_residenza="H879"))
+    assert user.codice_luogo_residenza is None
+    assert user.luogo_residenza == "san giorgio"
+
+
+def test_residence_resolves_an_active_comune(index):
+    user: schemas.UserBase = with_place_codes(index, make_user(luogo_residenza="roma"))
+    assert (user.codice_luogo_residenza, user.luogo_residenza) == ("H501", "Roma")
@@ -0,0 +1,110 @@
+from datetime import datetime
+from typing import Dict, List
+
+import pytest
+from pydantic import ValidationError
+
+from api import timing, timing_simulator
+from api.timing import LapTimer
+from database import models, schemas
+from database.database import SessionLocal, engine
+
+LAPS: int = 10
+LAP_SECONDS: float = 45.0
+
+
+def simulated_passings(transponders: List[str], laps: int = LAPS, seed: int = 0) -> List[schemas.Passing]:
+    return [
+        schemas.Passing(transponder=passing["transponder"], timestamp=datetime.fromisoformat(passing["timestamp"]))
+        for passing in timing_simulator.generate_passings(transponders, laps, LAP_SECONDS, seed=seed)
+    ]
+
+
+def test_replayed_passings_build_the_leaderboard():
+    timer = LapTimer()
+    timer.activate_group(1, {"T1": 10, "T2": 11, "T3": 12})
+    passings: List[schemas.Passing] = simulated_passings(["T1", "T2", "T3"])
+
+    for start in range(0, len(passings), 7):
+        timer.record(passings[start:start + 7])
+
+    leaderboard: List[schemas.LeaderboardEntry] = timer.leaderboard(1)
+    assert [entry.giri for entry in leaderboard] == [LAPS] * 3
+    assert {entry.user_id for entry in leaderboard} == {10, 11, 12}
+    assert [entry.miglior_giro for entry in leaderboard] == sorted(entry.miglior_giro for entry in leaderboard)
+    assert all(abs(entry.media_giri_recenti - LAP_SECONDS) < LAP_SECONDS * 0.1 for entry in leaderboard)
+    assert timer.pending == len(passings)
+
+
+def test_unknown_transponders_are_stored_without_group():
+    timer = LapTimer()
+    timer.activate_group(1, {"T1": 10})
+    timer.record(simulated_passings(["T1", "T9"], laps=2))
+
+    rows: List[Dict] = timer.drain()
+    assert {row["group_id"] for row in rows if row["transponder"] == "T9"} == {None}
+    assert [entry.transponder for entry in timer.leaderboard(1)] == ["T1"]
+
+
+def test_reused_transponder_moves_to_the_new_group():
+    timer = LapTimer()
+    timer.activate_group(1, {"T1": 10, "T2": 11})
+    timer.activate_group(2, {"T1": 20})
+    timer.record(simulated_passings(["T1", "T2"]))
+
+    assert [(entry.transponder, entry.user_id) for entry in timer.leaderboard(1)] == [("T2", 11)]
+    assert [(entry.transponder, entry.user_id, entry.giri) for entry in timer.leaderboard(2)] == [("T1", 20, LAPS)]
+
+    timer.activate_group(1, {"T2": 11})
+    assert [entry.transponder for entry in timer.leaderboard(2)] == ["T1"]
+
+
+def test_full_pending_queue_counts_dropped_passings(monkeypatch):
+    monkeypatch.setattr(timing, "MAX_PENDING_PASSINGS", 5)
+    timer = LapTimer()
+    timer.record(simulated_passings(["T1"], laps=7))
+
+    assert timer.pending == 5
+    assert timer.dropped == 3
+
+
+def test_requeue_into_a_full_queue_drops_the_oldest_rows(monkeypatch):
+    monkeypatch.setattr(timing, "MAX_PENDING_PASSINGS", 5)
+    timer = LapTimer()
+    timer.record(simulated_passings(["T1"], laps=4))
+    rows: List[Dict] = timer.drain(max_rows=3)
+    timer.record(simulated_passings(["T2"], laps=1))
+    timer.requeue(rows)
+
+    pending: List[Dict] = timer.drain()
+    assert timer.dropped == 2
+    assert pending[0] == rows[2]
+    assert [row["transponder"] for row in pending[-2:]] == ["T2", "T2"]
+
+
+def test_requeued_rows_are_drained_first():
+    timer = LapTimer()
+    timer.record(simulated_passings(["T1"], laps=4))
+    rows: List[Dict] = timer.drain(max_rows=2)
+    timer.requeue(rows)
+
+    assert timer.drain()[:2] == rows
+
+
+def test_transponder_longer_than_the_column_is_rejected():
+    with pytest.raises(ValidationError):
+        schemas.Passing(transponder="T" * (schemas.TRANSPONDER_MAX_LENGTH + 1), timestamp=datetime.now())
+
+
+def test_passings_are_written_with_generated_ids():
+    models.LapPassing.__table__.create(engine, checkfirst=True)
+    timer = LapTimer()
+    timer.activate_group(1, {"T1": 10})
+    timer.record(simulated_passings(["T1", "T9"], laps=2))
+
+    rows: List[Dict] = timer.drain()
+    rejected, unwritten, error = timing.write_passings(rows)
+    assert (rejected, unwritten, error) == ([], [], None)
+    with SessionLocal() as db:
+        ids: List[int] = [passing.id for passing in db.query(models.LapPassing).order_by(models.LapPassing.id)]
+    assert ids == list(range(1, len(rows) + 1))